@@ -0,0 +1,149 @@
+"""
+Синтетические входные файлы для замеров. Содержимое детерминировано (фиксированный seed),
+поэтому результаты разных запусков и машин сравнимы. Уже созданные файлы не пересоздаются.
+
+    python -m benchmarks.fixtures .bench-fixtures
+"""
+import argparse
+import os
+import random
+
+SEED = 2024
+
+# (имя, ширина, высота, контейнер)
+VIDEOS = [
+    ("video_360p", 640, 360, ".mp4"),
+    ("video_720p", 1280, 720, ".mp4"),
+    ("video_1080p", 1920, 1080, ".mp4"),
+    ("video_720p", 1280, 720, ".avi"),
+    ("video_360p", 640, 360, ".mkv"),
+    ("video_360p", 640, 360, ".mov"),
+]
+VIDEO_SECONDS = 5
+# Почти без потерь, с высоким битрейтом, чтобы сжатию было что убирать
+VIDEO_OPTIONS = {
+    ".mp4": {"codec:v": "libx264", "crf": 12, "preset": "ultrafast", "codec:a": "aac"},
+    ".mkv": {"codec:v": "libx264", "crf": 12, "preset": "ultrafast", "codec:a": "aac"},
+    ".mov": {"codec:v": "libx264", "crf": 12, "preset": "ultrafast", "codec:a": "aac"},
+    ".avi": {"codec:v": "mpeg4", "q:v": 2, "codec:a": "libmp3lame"},
+}
+
+# (имя, ширина, высота, формат)
+IMAGES = [
+    ("photo_small.jpg", 1024, 768, "JPEG"),
+    ("photo_large.jpg", 4000, 3000, "JPEG"),
+    ("screenshot.png", 1920, 1080, "PNG"),
+]
+GIF_FRAMES = 30
+
+PDF_TEXT_PAGES = 40
+PDF_SCAN_PAGES = 10
+
+
+def photo(width: int, height: int, rng: random.Random):
+    """
+    Плавный градиент с шумом: сжимается примерно как фотография, а не как однотонная заливка.
+    """
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.frombytes("L", (width, height), rng.randbytes(width * height))
+    channels = [Image.blend(gradient.rotate(angle, expand=False), noise, 0.25) for angle in (0, 90, 180)]
+    return Image.merge("RGB", channels)
+
+
+def make_video(path: str, width: int, height: int):
+    from src.tools.ffmpeg_pipeline import run_ffmpeg
+
+    ext = os.path.splitext(path)[1]
+    run_ffmpeg(
+        [
+            (f"testsrc2=size={width}x{height}:rate=30:duration={VIDEO_SECONDS}", {"f": "lavfi"}),
+            (f"sine=frequency=440:duration={VIDEO_SECONDS}", {"f": "lavfi"}),
+        ],
+        path,
+        {**VIDEO_OPTIONS[ext], "pix_fmt": "yuv420p", "shortest": None},
+    )
+
+
+def make_image(path: str, width: int, height: int, image_format: str, rng: random.Random):
+    image = photo(width, height, rng)
+    if image_format == "PNG":
+        image = image.convert("RGBA")
+        image.save(path, image_format)
+    else:
+        image.save(path, image_format, quality=95)
+
+
+def make_gif(path: str, rng: random.Random):
+    base = photo(320, 240, rng)
+    frames = [base.rotate(index * 360 / GIF_FRAMES).quantize(64) for index in range(GIF_FRAMES)]
+    frames[0].save(path, "GIF", save_all=True, append_images=frames[1:], duration=40, loop=0)
+
+
+def make_text_pdf(path: str):
+    import fitz
+
+    doc = fitz.open()
+    line = "Konvera benchmark text page. " * 3
+    for number in range(PDF_TEXT_PAGES):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Page {number + 1}", fontsize=18)
+        page.insert_textbox(fitz.Rect(50, 90, 545, 800), "\n".join([line] * 40), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def make_scan_pdf(path: str, rng: random.Random):
+    """
+    Страницы A4 с полностраничными изображениями 300 dpi, как у отсканированного документа.
+    """
+    import io
+
+    import fitz
+
+    doc = fitz.open()
+    for _ in range(PDF_SCAN_PAGES):
+        page = doc.new_page()
+        buffer = io.BytesIO()
+        photo(2480, 3508, rng).save(buffer, "JPEG", quality=90)
+        page.insert_image(page.rect, stream=buffer.getvalue())
+    doc.save(path)
+    doc.close()
+
+
+def generate_fixtures(directory: str) -> list[str]:
+    """
+    Создаёт недостающие входные файлы в directory и возвращает пути ко всем.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+
+    def ensure(name: str, make):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            make(path)
+        paths.append(path)
+
+    for name, width, height, ext in VIDEOS:
+        ensure(name + ext, lambda path, w=width, h=height: make_video(path, w, h))
+    # У каждого файла свой генератор, поэтому содержимое не зависит от того, какие файлы уже созданы
+    for index, (name, width, height, image_format) in enumerate(IMAGES):
+        ensure(name, lambda path, w=width, h=height, f=image_format, seed=SEED + index:
+               make_image(path, w, h, f, random.Random(seed)))
+    ensure("animation.gif", lambda path: make_gif(path, random.Random(SEED + len(IMAGES))))
+    ensure("text.pdf", make_text_pdf)
+    ensure("scan.pdf", lambda path: make_scan_pdf(path, random.Random(SEED + len(IMAGES) + 1)))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=".bench-fixtures")
+    args = parser.parse_args()
+    for path in generate_fixtures(args.directory):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Замеры всех путей конвертации и сжатия на синтетических файлах (см. benchmarks.fixtures).
+Каждый случай выполняется в отдельном процессе с выключенным кэшем результатов. Записываются время,
+процессорное время и пиковая память (вместе с ffmpeg и пулом процессов), размер результата и степень сжатия.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --only optimize --processes 4 --output bench-4.json
+    python -m benchmarks.run compare baseline.json bench.json
+    python -m benchmarks.run quality
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import generate_fixtures
+
+# Допустимый рост относительно базового замера, прежде чем случай считается регрессией
+TIME_THRESHOLD = 0.15
+MEMORY_THRESHOLD = 0.2
+SIZE_THRESHOLD = 0.02
+# Насколько PSNR сегментированного кодирования может быть ниже кодирования целиком, дБ
+PSNR_THRESHOLD = 0.5
+
+
+def list_cases(fixtures: list[str], only: str = None) -> list[dict]:
+    """
+    Все пары (файл, целевой формат) для конвертации и все файлы, которые умеет сжимать FileOptimizer.
+    """
+    from src.tools.converter import FileConverter
+    from src.tools.optimize import FileOptimizer
+
+    cases = []
+    for path in fixtures:
+        name = os.path.basename(path)
+        if only in (None, "convert"):
+            for target in asyncio.run(FileConverter(path).get_available_formats()):
+                cases.append({"id": f"convert:{name}:{target}", "action": "convert", "input": path, "format": target})
+        if only in (None, "optimize") and FileOptimizer.is_format_supported(os.path.splitext(path)[1]):
+            cases.append({"id": f"optimize:{name}", "action": "optimize", "input": path, "format": None})
+    return cases
+
+
+def resource_usage() -> dict:
+    """
+    Процессорное время и пиковая память текущего процесса и его завершённых потомков (ffmpeg, пул процессов).
+    На Windows модуля resource нет, и значения не записываются.
+    """
+    try:
+        import resource
+    except ImportError:
+        return {"cpu_s": None, "peak_rss_mb": None}
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss в килобайтах на Linux и в байтах на macOS
+    unit = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return {
+        "cpu_s": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        "peak_rss_mb": max(own.ru_maxrss, children.ru_maxrss) / unit,
+    }
+
+
+def run_case(action: str, input_path: str, target_format: str, output_dir: str, threads: int, processes: int) -> dict:
+    """
+    Выполняет один случай в текущем процессе. Вызывается в дочернем процессе через подкоманду case.
+    """
+    from src.config import get_config
+    from src.utils.executor import get_executors
+
+    config = get_config()
+    # Результат из кэша сделал бы замер бессмысленным
+    config.cache.enabled = False
+    config.workers.threads = threads
+    config.workers.processes = processes
+
+    base, ext = os.path.splitext(os.path.basename(input_path))
+    if action == "convert":
+        from src.tools.converter import FileConverter
+
+        output_path = os.path.join(output_dir, base + target_format)
+        operation = FileConverter(input_path).convert_to_format(target_format, output_path)
+    else:
+        from src.tools.optimize import FileOptimizer
+
+        output_path = os.path.join(output_dir, base + "_optimized" + ext)
+        operation = FileOptimizer.optimize_file(input_path, output_path)
+
+    started = time.perf_counter()
+    try:
+        result = asyncio.run(operation)
+    finally:
+        # Процессы пула дожидаются завершения до замера, чтобы их время и память попали в RUSAGE_CHILDREN
+        get_executors().shutdown(wait=True)
+    wall = time.perf_counter() - started
+
+    outputs = [result] if os.path.isfile(result) else [
+        os.path.join(root, name) for root, _, names in os.walk(result) for name in names
+    ]
+    return {"wall_s": wall, **resource_usage(), "output_size": sum(os.path.getsize(path) for path in outputs)}
+
+
+def measure(case: dict, threads: int, processes: int) -> dict:
+    """
+    Один прогон случая в отдельном процессе, чтобы память и импорты прошлых случаев не влияли на замер.
+    """
+    output_dir = tempfile.mkdtemp(prefix="konvera-bench-")
+    try:
+        command = [
+            sys.executable, "-m", "benchmarks.run", "case", case["action"], case["input"],
+            "--output-dir", output_dir, "--threads", str(threads), "--processes", str(processes),
+        ]
+        if case["format"]:
+            command += ["--format", case["format"]]
+        result = subprocess.run(command, capture_output=True, text=True)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    if result.returncode != 0:
+        return {"error": (result.stderr.strip().splitlines() or ["неизвестная ошибка"])[-1]}
+    return json.loads(result.stdout)
+
+
+def check_segmented_quality(fixtures_dir: str, crf: str = "23", preset: str = "veryfast", segments: int = 2,
+                            threshold: float = PSNR_THRESHOLD) -> tuple[dict, list[str]]:
+    """
+    Кодирует каждое видео libx264 целиком и по сегментам с одинаковыми crf/preset и сравнивает число кадров
+    и PSNR обоих результатов относительно исходника. Возвращает замеры и список видео, где кадры не совпадают
+    или сегменты хуже больше threshold дБ.
+    """
+    from src.tools.ffmpeg_pipeline import measure_psnr
+    from src.tools.optimize import FileOptimizer
+    from src.tools.probe import probe_media
+    from src.tools.segmented import count_video_packets, encode_segmented
+    from src.utils.executor import get_executors
+
+    videos = [
+        path for path in generate_fixtures(fixtures_dir)
+        if os.path.splitext(path)[1] in (".mp4", ".mkv", ".mov", ".avi")
+    ]
+    results = {}
+    regressions = []
+    output_dir = tempfile.mkdtemp(prefix="konvera-bench-")
+    try:
+        for path in videos:
+            name = os.path.basename(path)
+            base, ext = os.path.splitext(name)
+            info = probe_media(path)
+            single = os.path.join(output_dir, base + "_single" + ext)
+            segmented = os.path.join(output_dir, base + "_segmented" + ext)
+            FileOptimizer._optimize_video(path, single, crf, preset, 0)
+            if asyncio.run(encode_segmented(path, segmented, info, crf, preset, segments)) is None:
+                results[name] = {"error": "число кадров после сегментов не совпадает с исходником"}
+                regressions.append(f"{name}: {results[name]['error']}")
+                continue
+            if count_video_packets(segmented) != count_video_packets(single):
+                results[name] = {"error": "число кадров по сегментам и целиком различается"}
+                regressions.append(f"{name}: {results[name]['error']}")
+                continue
+
+            single_psnr, segmented_psnr = measure_psnr(path, single), measure_psnr(path, segmented)
+            results[name] = {"single_psnr": single_psnr, "segmented_psnr": segmented_psnr}
+            if single_psnr - segmented_psnr > threshold:
+                regressions.append(f"{name}: PSNR по сегментам {segmented_psnr:.2f} дБ, целиком {single_psnr:.2f} дБ")
+            print(f"{name}: {results[name]}", file=sys.stderr)
+    finally:
+        get_executors().shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return results, regressions
+
+
+def run(fixtures_dir: str, runs: int, only: str, pattern: str, threads: int, processes: int) -> dict:
+    fixtures = generate_fixtures(fixtures_dir)
+    cases = [case for case in list_cases(fixtures, only) if not pattern or pattern in case["id"]]
+    report = {
+        "python": sys.version,
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "threads": threads,
+        "processes": processes,
+        "runs": runs,
+        "cases": {},
+    }
+    for case in cases:
+        input_size = os.path.getsize(case["input"])
+        samples = [measure(case, threads, processes) for _ in range(runs)]
+        failed = next((sample for sample in samples if "error" in sample), None)
+        if failed is not None:
+            report["cases"][case["id"]] = {"error": failed["error"]}
+        else:
+            output_size = samples[-1]["output_size"]
+            report["cases"][case["id"]] = {
+                "wall_s": statistics.median(sample["wall_s"] for sample in samples),
+                "cpu_s": samples[-1]["cpu_s"] and statistics.median(sample["cpu_s"] for sample in samples),
+                "peak_rss_mb": samples[-1]["peak_rss_mb"] and max(sample["peak_rss_mb"] for sample in samples),
+                "input_size": input_size,
+                "output_size": output_size,
+                "ratio": round(output_size / input_size, 4) if input_size else None,
+            }
+        print(f"{case['id']}: {report['cases'][case['id']]}", file=sys.stderr)
+    return report
+
+
+def compare(baseline: dict, current: dict, time_threshold: float = TIME_THRESHOLD,
+            memory_threshold: float = MEMORY_THRESHOLD, size_threshold: float = SIZE_THRESHOLD) -> list[str]:
+    """
+    Список регрессий current относительно baseline: новые ошибки и рост времени, памяти или размера результата
+    больше допустимого.
+    """
+    limits = {"wall_s": time_threshold, "peak_rss_mb": memory_threshold, "output_size": size_threshold}
+    regressions = []
+    for case_id, before in baseline["cases"].items():
+        after = current["cases"].get(case_id)
+        if after is None or "error" in before:
+            continue
+        if "error" in after:
+            regressions.append(f"{case_id}: ошибка {after['error']}")
+            continue
+        for metric, limit in limits.items():
+            if before[metric] and after[metric] is not None and after[metric] > before[metric] * (1 + limit):
+                change = after[metric] / before[metric] - 1
+                regressions.append(f"{case_id}: {metric} {before[metric]:.3f} -> {after[metric]:.3f} (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=".bench-fixtures", help="папка для синтетических входных файлов")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--only", choices=("convert", "optimize"))
+    parser.add_argument("-k", dest="pattern", help="только случаи, в идентификаторе которых есть эта строка")
+    parser.add_argument("--threads", type=int, default=0, help="размер пула потоков (0 - по числу ядер)")
+    parser.add_argument("--processes", type=int, default=0, help="размер пула процессов (0 - по числу ядер)")
+    parser.add_argument("--output", help="файл JSON для результатов (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="сравнить результаты с сохранённым замером")
+    commands = parser.add_subparsers(dest="command")
+
+    case = commands.add_parser("case", help="выполнить один случай (используется внутри замеров)")
+    case.add_argument("action", choices=("convert", "optimize"))
+    case.add_argument("input")
+    case.add_argument("--format")
+    case.add_argument("--output-dir", required=True)
+    case.add_argument("--threads", type=int, default=0)
+    case.add_argument("--processes", type=int, default=0)
+
+    compare_parser = commands.add_parser("compare", help="сравнить два сохранённых замера")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    compare_parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD)
+    compare_parser.add_argument("--size-threshold", type=float, default=SIZE_THRESHOLD)
+
+    quality = commands.add_parser("quality", help="сравнить PSNR сегментированного кодирования и кодирования целиком")
+    quality.add_argument("--threshold", type=float, default=PSNR_THRESHOLD, help="допустимое снижение PSNR, дБ")
+    args = parser.parse_args()
+
+    if args.command == "case":
+        result = run_case(args.action, args.input, args.format, args.output_dir, args.threads, args.processes)
+        print(json.dumps(result))
+        return 0
+
+    if args.command == "quality":
+        _, regressions = check_segmented_quality(args.fixtures, threshold=args.threshold)
+    elif args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.time_threshold, args.memory_threshold, args.size_threshold)
+    else:
+        report = run(args.fixtures, args.runs, args.only, args.pattern, args.threads, args.processes)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            print(text)
+        if not args.baseline:
+            return 0
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report)
+
+    for line in regressions:
+        print(line, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Замер времени запуска: время импорта (-X importtime) и полное время процесса
+для графического приложения и для запуска без интерфейса.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+TARGETS = {
+    "gui": ["-c", "import src.app"],
+    "cli": ["-m", "src", "--help"],
+}
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """
+    Разбирает строки вида "import time: self [us] | cumulative | imported package".
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return modules
+
+
+def measure(args: list[str]) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    modules = parse_importtime(result.stderr)
+    return {
+        "returncode": result.returncode,
+        "wall_s": wall,
+        "import_s": sum(module["self_us"] for module in modules) / 1e6,
+        "modules": modules,
+    }
+
+
+def run(runs: int, top: int) -> dict:
+    report = {"python": sys.version, "runs": runs, "targets": {}}
+    for name, args in TARGETS.items():
+        samples = [measure(args) for _ in range(runs)]
+        # Модули верхнего уровня последнего прогона, отсортированные по накопленному времени
+        heaviest = sorted(
+            (module for module in samples[-1]["modules"] if module["depth"] <= 1),
+            key=lambda module: module["cumulative_us"],
+            reverse=True,
+        )[:top]
+        report["targets"][name] = {
+            "returncode": samples[-1]["returncode"],
+            "wall_s": statistics.median(sample["wall_s"] for sample in samples),
+            "import_s": statistics.median(sample["import_s"] for sample in samples),
+            "heaviest_imports": heaviest,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="сколько самых тяжёлых импортов сохранить")
+    parser.add_argument("--output", help="файл JSON для результатов (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = run(args.runs, args.top)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
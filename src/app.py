@@ -1,24 +1,33 @@
-import random
 from typing import Optional
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QFileDialog,
     QComboBox, QProgressBar, QGraphicsColorizeEffect
 )
-from PyQt6.QtGui import QDragEnterEvent, QDragLeaveEvent, QDropEvent, QColor, QIcon
+from PyQt6.QtGui import QDragEnterEvent, QDragLeaveEvent, QDropEvent, QColor, QIcon, QPixmap
 from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QEvent
 import qasync
 
 import sys
 import os
 import asyncio
+import multiprocessing
 
 from src.config import config
+from src.logs.logs import configure_logging
+from src.tools.batch import BatchQueue, collect_files
 from src.tools.converter import FileConverter
 from src.tools.optimize import FileOptimizer
+from src.tools.preview import get_preview
 from src.utils.exception_handler import exception_handler
+from src.utils.executor import get_executors
+from src.utils.progress import ProgressStream
 from src.utils.resource_path import resource_path
 
+WINDOW_SIZE = (400, 440)
+# Высота области миниатюры, на неё окно увеличивается, пока миниатюра показана
+PREVIEW_HEIGHT = 140
+
 
 class Konvera(QWidget):
     def __init__(self):
@@ -30,11 +39,13 @@ class Konvera(QWidget):
         self.converter: Optional[FileConverter] = None
         self.setWindowTitle(self.config.main.title)
         self.setWindowIcon(QIcon(resource_path("resource/icon.ico")))
-        self.setFixedSize(400, 440)
+        self.setFixedSize(*WINDOW_SIZE)
         self.setAcceptDrops(True)
         self.file_path = None
+        self.batch_files: list[str] = []
         self.drag_effect = None
         self.drag_animation = None
+        self.preview_task: Optional[asyncio.Future] = None
         self.setup_ui()
 
     def setup_ui(self):
@@ -96,6 +107,11 @@ class Konvera(QWidget):
         self.label.setObjectName("DropLabel")
         self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
+        self.preview = QLabel()
+        self.preview.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview.setFixedHeight(PREVIEW_HEIGHT)
+        self.preview.setVisible(False)
+
         self.drag_effect = QGraphicsColorizeEffect()
         self.drag_effect.setColor(QColor("#2b2b3c"))
         self.drag_effect.setStrength(0.0)
@@ -125,6 +141,7 @@ class Konvera(QWidget):
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
 
+        layout.addWidget(self.preview)
         layout.addWidget(self.label)
         layout.addWidget(self.choose_button)
         layout.addWidget(self.format_combo)
@@ -136,13 +153,54 @@ class Konvera(QWidget):
         self.installEventFilter(self)
 
     async def choose_file(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Выберите файл")
-        if path:
-            await self.set_file(path)
+        paths, _ = QFileDialog.getOpenFileNames(self, "Выберите файлы")
+        if paths:
+            await self.set_files(paths)
+
+    async def set_files(self, paths):
+        """
+        Один файл открывается как обычно, несколько файлов или папки - как пакет.
+        """
+        if len(paths) == 1 and os.path.isfile(paths[0]):
+            await self.set_file(paths[0])
+            return
+
+        self.file_path = None
+        self.hide_preview()
+        self.batch_files = collect_files(paths)
+        self.compress_button.setVisible(False)
+        self.format_combo.clear()
+        if not self.batch_files:
+            self.label.setText("Нет файлов поддерживаемых форматов")
+            self.format_combo.addItems(["Не поддерживаемый формат"])
+            self.format_combo.setDisabled(True)
+            return
+
+        self.label.setText(f"Выбрано файлов: {len(self.batch_files)}")
+
+        # Предлагаются только форматы, доступные для всех выбранных файлов
+        formats = None
+        for path in self.batch_files:
+            file_formats = await FileConverter(path).get_available_formats()
+            formats = file_formats if formats is None else [f for f in formats if f in file_formats]
+        if formats:
+            self.format_combo.setDisabled(False)
+            self.format_combo.addItems(formats)
+        else:
+            self.format_combo.setDisabled(True)
+            self.format_combo.addItems(["Нет общего формата"])
+
+        self.optimizer = FileOptimizer()
+        if any(self.optimizer.is_format_supported(os.path.splitext(path)[1]) for path in self.batch_files):
+            self.compress_button.setVisible(True)
 
     async def set_file(self, path):
         self.file_path = path
+        self.batch_files = []
+        self.compress_button.setVisible(False)
         self.label.setText(f"Выбран файл:\n{os.path.basename(path)}")
+        self.hide_preview()
+        self.preview_task = asyncio.ensure_future(self.show_preview(path))
 
         self.converter = FileConverter(self.file_path)
         formats = await self.converter.get_available_formats()
@@ -159,7 +217,37 @@ class Konvera(QWidget):
         if self.optimizer.is_format_supported(self.converter.extension):
             self.compress_button.setVisible(True)
 
+    async def show_preview(self, path):
+        """
+        Показывает миниатюру файла. Миниатюра строится в пуле потоков, повторный выбор файла берёт её из кэша.
+        """
+        data = await get_preview(path)
+        if not data or path != self.file_path:
+            return
+        pixmap = QPixmap()
+        if not pixmap.loadFromData(data):
+            return
+        self.preview.setPixmap(pixmap.scaled(
+            self.width(), PREVIEW_HEIGHT,
+            Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation,
+        ))
+        self.setFixedSize(WINDOW_SIZE[0], WINDOW_SIZE[1] + PREVIEW_HEIGHT)
+        self.preview.setVisible(True)
+
+    def hide_preview(self):
+        if self.preview_task is not None:
+            self.preview_task.cancel()
+            self.preview_task = None
+        self.preview.setVisible(False)
+        self.preview.clear()
+        self.setFixedSize(*WINDOW_SIZE)
+
     async def convert_file(self):
+        if self.batch_files:
+            if self.format_combo.isEnabled():
+                await self.run_batch('convert', self.format_combo.currentText())
+            return
+
         if not self.file_path:
             self.label.setText("Выберите файл")
             return
@@ -167,28 +255,26 @@ class Konvera(QWidget):
         format_selected = self.format_combo.currentText()
         self.label.setText(f"Конвертация в {format_selected}...")
 
-        progress_task = asyncio.create_task(self.simulate_progress(max_value=random.randint(80, 90)))
+        progress = ProgressStream()
         try:
-            await self.converter.convert_to_format(format_selected)
+            await self.track_progress(self.converter.convert_to_format(format_selected, progress=progress), progress)
         except Exception as e:
             self.label.setText(f"❌ Произошла ошибка: {e}")
-        finally:
-            progress_task.cancel()
-            try:
-                await progress_task
-            except asyncio.CancelledError:
-                pass
+            return
 
         await self.complete_progress("✅ Конвертация завершена!")
 
-    async def simulate_progress(self, max_value: int = 90):
+    async def track_progress(self, coro, progress: ProgressStream):
         """
-        Симулирует заполнение прогресс-бара до max_value
+        Выполняет coro и переносит сообщаемый ею прогресс на прогресс-бар.
         """
         self.progress_bar.setValue(0)
-        for i in range(1, max_value + 1):
-            await asyncio.sleep(0.008)
-            self.progress_bar.setValue(i)
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(lambda _: progress.close())
+        async for done, total in progress:
+            if total:
+                self.progress_bar.setValue(min(done * 100 // total, 100))
+        return await task
 
     async def complete_progress(self, done_message):
         """
@@ -213,24 +299,50 @@ class Konvera(QWidget):
         except Exception as e:
             self.label.setText(f"❌ Error: {e}")
 
+    async def run_batch(self, action: str, target_format: Optional[str] = None):
+        """
+        Обрабатывает выбранные файлы через очередь, прогресс считается по завершённым задачам.
+        """
+        queue = BatchQueue()
+        jobs = queue.add_files(self.batch_files, action, target_format)
+        done = 0
+
+        def on_job_done(_job):
+            nonlocal done
+            done += 1
+            self.progress_bar.setValue(done * 100 // len(jobs))
+            self.label.setText(f"Обработано {done} из {len(jobs)}")
+
+        self.progress_bar.setValue(0)
+        # Пользователь ждёт первые результаты, поэтому короткие задачи идут первыми
+        await queue.run(on_job_done, self.config.scheduler.interactive_policy)
+
+        failed = sum(job.status == 'failed' for job in jobs)
+        skipped = sum(job.status == 'skipped' for job in jobs)
+        message = f"✅ Готово: {len(jobs) - failed - skipped}"
+        if skipped:
+            message += f", пропущено: {skipped}"
+        if failed:
+            message += f", ошибок: {failed}"
+        await self.complete_progress(message)
+
     async def compress_file(self):
+        if self.batch_files:
+            await self.run_batch('optimize')
+            return
+
         if not self.file_path:
             self.label.setText("Выберите файл")
             return
 
-        progress_task = asyncio.create_task(self.simulate_progress(max_value=random.randint(80, 90)))
+        progress = ProgressStream()
         try:
-            await self.optimizer.optimize_file(self.file_path)
+            await self.track_progress(self.optimizer.optimize_file(self.file_path, progress=progress), progress)
         except Exception as e:
             self.label.setText(f"❌ Произошла ошибка: {e}")
-        finally:
-            progress_task.cancel()
-            try:
-                await progress_task
-            except asyncio.CancelledError:
-                pass
-
-        # После завершения конвертации доводим прогресс до 100%
+            return
+
+        # После завершения сжатия доводим прогресс до 100%
         await self.complete_progress("✅ Сжатие завершено!")
 
     def dragEnterEvent(self, event: QDragEnterEvent):
@@ -243,8 +355,8 @@ class Konvera(QWidget):
 
     def dropEvent(self, event: QDropEvent):
         if event.mimeData().hasUrls():
-            path = event.mimeData().urls()[0].toLocalFile()
-            asyncio.ensure_future(self.set_file(path))
+            paths = [url.toLocalFile() for url in event.mimeData().urls()]
+            asyncio.ensure_future(self.set_files(paths))
             self.animate_drag_leave()
 
     def animate_drag_enter(self):
@@ -270,6 +382,9 @@ class Konvera(QWidget):
 
 
 if __name__ == '__main__':
+    # Пул процессов в собранном PyInstaller приложении запускает воркеры через этот же exe
+    multiprocessing.freeze_support()
+    configure_logging(config.logging)
     sys.excepthook = exception_handler
 
     app = QApplication(sys.argv)
@@ -279,3 +394,4 @@ if __name__ == '__main__':
     window.show()
     with loop:
         loop.run_forever()
+    get_executors().shutdown()
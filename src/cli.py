@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+from src.tools.batch import BatchJob, BatchQueue
+from src.utils.executor import get_executors
+
+MEDIA_TYPES = ("video", "image", "document")
+JOBS_HELP = "сколько файлов обрабатывать одновременно, заменяет пределы по типам из [batch]"
+
+
+def expand_inputs(patterns: list[str]) -> list[str]:
+    """
+    Раскрывает шаблоны glob (включая **). Пути без совпадений передаются как есть,
+    чтобы папки и файлы с особыми символами в имени тоже работали.
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(matches or [pattern])
+    return paths
+
+
+def job_summary(job: BatchJob) -> dict:
+    # Исходник мог быть удалён или перемещён, пока шла обработка
+    input_size = os.path.getsize(job.input_path) if os.path.isfile(job.input_path) else None
+    output_size = os.path.getsize(job.result) if job.result and os.path.isfile(job.result) else None
+    return {
+        "input": job.input_path,
+        "output": job.result,
+        "action": job.action,
+        "target_format": job.target_format,
+        "status": job.status,
+        "error": job.error,
+        "seconds": round(job.duration, 3) if job.duration is not None else None,
+        "input_size": input_size,
+        "output_size": output_size,
+        "saved_bytes": input_size - output_size if None not in (input_size, output_size) else None,
+        "ratio": round(output_size / input_size, 4) if output_size is not None and input_size else None,
+    }
+
+
+def build_summary(jobs: list[BatchJob], seconds: float) -> dict:
+    items = [job_summary(job) for job in jobs]
+    done = [item for item in items if item["status"] == "done"]
+    input_size = sum(item["input_size"] or 0 for item in done)
+    output_size = sum(item["output_size"] or 0 for item in done)
+    return {
+        "seconds": round(seconds, 3),
+        "total": len(items),
+        "done": len(done),
+        "skipped": sum(item["status"] == "skipped" for item in items),
+        "failed": sum(item["status"] == "failed" for item in items),
+        "input_size": input_size,
+        "output_size": output_size,
+        "saved_bytes": input_size - output_size,
+        "jobs": items,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="konvera", description="Конвертация и сжатие файлов без интерфейса.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(command: argparse.ArgumentParser):
+        command.add_argument("inputs", nargs="+", help="файлы, папки или шаблоны glob")
+        command.add_argument("-o", "--output-dir", help="папка для результатов (по умолчанию рядом с исходниками)")
+        command.add_argument("-j", "--jobs", type=int, default=None, help=JOBS_HELP)
+        command.add_argument("--summary", help="куда записать JSON-отчёт ('-' - в stdout)")
+
+    convert = commands.add_parser("convert", help="конвертировать файлы в другой формат")
+    add_common(convert)
+    convert.add_argument("-f", "--format", required=True, help="целевой формат, например .mp4")
+
+    optimize = commands.add_parser("optimize", help="сжать файлы")
+    add_common(optimize)
+    optimize.add_argument("--crf", help="crf для видео")
+    optimize.add_argument("--preset", help="preset для видео")
+    optimize.add_argument("--quality", type=int, help="качество JPEG (1-95)")
+    optimize.add_argument("--max-size", type=int, help="наибольшая сторона изображения в пикселях")
+    optimize.add_argument("--strip-metadata", action="store_true", default=None, help="удалить EXIF и ICC")
+    optimize.add_argument("--target-size", type=int, help="желаемый размер JPEG в байтах")
+
+    watch = commands.add_parser("watch", help="обрабатывать новые файлы в папках по правилам из [watch]")
+    watch.add_argument("directories", nargs="*", help="папки для наблюдения (по умолчанию из настроек)")
+    watch.add_argument("-o", "--output-dir", help="папка для результатов (по умолчанию рядом с исходниками)")
+    watch.add_argument("-j", "--jobs", type=int, default=None, help=JOBS_HELP)
+    watch.add_argument("--poll", action="store_true", help="опрашивать папки вместо inotify")
+    watch.add_argument("--state", help="файл базы состояния SQLite")
+
+    serve = commands.add_parser("serve", help="HTTP API конвертации и сжатия по настройкам из [server]")
+    serve.add_argument("--host", help="адрес (по умолчанию из настроек)")
+    serve.add_argument("--port", type=int, help="порт (по умолчанию из настроек)")
+    return parser
+
+
+def create_queue(args: argparse.Namespace) -> BatchQueue:
+    """
+    Очередь с пределами из [batch] или, если задан -j, с одним пределом на все типы файлов.
+    """
+    if not args.jobs:
+        return BatchQueue()
+    return BatchQueue(limits={kind: args.jobs for kind in MEDIA_TYPES}, max_jobs=args.jobs)
+
+
+async def run_batch(args: argparse.Namespace) -> list[BatchJob]:
+    queue = create_queue(args)
+    inputs = expand_inputs(args.inputs)
+    if args.command == "convert":
+        target_format = args.format if args.format.startswith(".") else "." + args.format
+        queue.add_files(inputs, "convert", target_format, args.output_dir)
+    else:
+        options = {
+            key: getattr(args, key)
+            for key in ("crf", "preset", "quality", "max_size", "strip_metadata", "target_size")
+            if getattr(args, key) is not None
+        }
+        queue.add_files(inputs, "optimize", output_dir=args.output_dir, **options)
+
+    return await queue.run(print_job)
+
+
+def print_job(job: BatchJob):
+    line = f"[{job.status}] {job.input_path}"
+    if job.result:
+        line += f" -> {job.result}"
+    if job.error:
+        line += f": {job.error}"
+    print(line, file=sys.stderr)
+
+
+async def run_watch(args: argparse.Namespace):
+    from src.tools.watch import WatchService
+
+    options = {"queue": create_queue(args), "on_job_done": print_job}
+    if args.poll:
+        options["use_inotify"] = False
+    if args.state:
+        options["state_path"] = args.state
+    await WatchService.from_config(args.directories, args.output_dir, **options).run()
+
+
+async def run_server(args: argparse.Namespace):
+    from src.server import serve
+
+    await serve(args.host, args.port)
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    from src.config import config
+    from src.logs.logs import configure_logging
+
+    # stdout занят JSON-отчётом (--summary -), поэтому журнал пишется в stderr
+    configure_logging(config.logging, sys.stderr)
+
+    if args.command in ("watch", "serve"):
+        try:
+            asyncio.run(run_watch(args) if args.command == "watch" else run_server(args))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            get_executors().shutdown()
+        return 0
+
+    started = time.perf_counter()
+    try:
+        jobs = asyncio.run(run_batch(args))
+    finally:
+        get_executors().shutdown()
+    summary = build_summary(jobs, time.perf_counter() - started)
+
+    if args.summary == "-":
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    return 1 if summary["failed"] else 0
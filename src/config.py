@@ -1,7 +1,8 @@
-from dynaconf import Dynaconf
+from functools import cache
+
 from pydantic import BaseModel
 
-from src.logs.config import LogConfig
+from src.logs.config import LogConfig, MetricsConfig
 from src.utils.resource_path import resource_path
 
 
@@ -9,9 +10,117 @@ class Main(BaseModel):
     title: str
 
 
+class Workers(BaseModel):
+    threads: int
+    processes: int
+
+
+class Batch(BaseModel):
+    video: int
+    image: int
+    document: int
+    max_jobs: int
+
+
+class Scheduler(BaseModel):
+    enabled: bool
+    cpu_budget: float
+    memory_budget_mb: int
+    batch_policy: str
+    interactive_policy: str
+    model_path: str
+
+
+class Cache(BaseModel):
+    enabled: bool
+    directory: str
+    max_size_mb: int
+
+
+class Pdf(BaseModel):
+    chunk_pages: int
+    parallel_min_pages: int
+    docx_workers: int
+    max_dpi: int
+    jpeg_quality: int
+    subset_fonts: bool
+    save_mode: str
+    raster_dpi: int
+    raster_jpeg_quality: int
+    raster_chunk_pages: int
+
+
+class Video(BaseModel):
+    threads: int
+    segmented: bool
+    segment_min_duration: int
+    segment_min_seconds: int
+
+
+class Frames(BaseModel):
+    count: int
+    columns: int
+    width: int
+    keyframes_only: bool
+    jpeg_quality: int
+
+
+class Animation(BaseModel):
+    max_width: int
+    max_fps: float
+
+
+class Preview(BaseModel):
+    enabled: bool
+    size: int
+    memory_items: int
+    disk_cache: bool
+    directory: str
+    disk_max_mb: int
+
+
+class Server(BaseModel):
+    host: str
+    port: int
+    directory: str
+    max_upload_mb: int
+    result_ttl: int
+    max_jobs: int
+
+
+class WatchRule(BaseModel):
+    extensions: list[str]
+    action: str
+    format: str = ""
+    options: dict = {}
+
+
+class Watch(BaseModel):
+    directories: list[str]
+    output_dir: str
+    recursive: bool
+    debounce: float
+    poll_interval: float
+    use_inotify: bool
+    state_db: str
+    rules: list[WatchRule]
+
+
 class Config(BaseModel):
     main: Main
     logging: LogConfig
+    metrics: MetricsConfig
+    workers: Workers
+    batch: Batch
+    scheduler: Scheduler
+    cache: Cache
+    pdf: Pdf
+    video: Video
+    frames: Frames
+    animation: Animation
+    preview: Preview
+    server: Server
+    watch: Watch
 
     class Config:
         alias_generator = str.upper
@@ -19,8 +128,19 @@ class Config(BaseModel):
 
 
 def parse_config():
+    from dynaconf import Dynaconf
+
     settings = Dynaconf(envvar_prefix=False, settings_files=[resource_path("settings.toml")], load_dotenv=False)
     return Config.model_validate(settings.as_dict())
 
 
-config = parse_config()
+@cache
+def get_config() -> Config:
+    return parse_config()
+
+
+def __getattr__(name):
+    # Конфигурация читается при первом обращении к src.config.config, а не при импорте модуля
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
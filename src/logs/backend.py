@@ -0,0 +1,179 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+# Значение в очереди, по которому фоновый поток дописывает остаток и завершается
+_STOP = object()
+
+LOGGER_METHODS = (
+    "debug", "info", "msg", "warning", "warn", "error", "err", "critical", "fatal", "exception", "failure", "log",
+)
+
+
+class RotatingFileSink:
+    """
+    Файл журнала с ротацией по размеру: log -> log.1 -> ... -> log.{backups}.
+    Используется только из фонового потока записи.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def write(self, text: str):
+        if self.max_bytes and self.size and self.size + len(text) > self.max_bytes:
+            self.rotate()
+        self.file.write(text)
+        self.size += len(text)
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = 0
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class LogWriter:
+    """
+    Фоновый поток журнала. Вызывающий поток только кладёт событие в очередь, а отрисовка
+    (JSON или консольный формат) и запись выполняются здесь, пачками до batch_size записей.
+    Вывод сбрасывается, когда очередь опустела, а при непрерывном потоке событий - раз в flush_interval секунд.
+    """
+
+    def __init__(self, sinks: list, batch_size: int = 256, flush_interval: float = 0.5):
+        self.sinks = sinks
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="konvera-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(self, render: Callable[[], str]):
+        self.queue.put(render)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for render in batch:
+                if render is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    lines.append(render() + "\n")
+                except Exception as e:
+                    # Ошибка отрисовки одного события не должна останавливать журнал
+                    lines.append(f"log rendering failed: {e!r}\n")
+            text = "".join(lines)
+            flush = stopping or self.queue.empty() or time.monotonic() - last_flush >= self.flush_interval
+            for sink in self.sinks:
+                try:
+                    sink.write(text)
+                    if flush:
+                        sink.flush()
+                except (OSError, ValueError):
+                    # Закрытый поток вывода не должен останавливать запись в остальные
+                    pass
+            if flush:
+                last_flush = time.monotonic()
+
+    def stop(self):
+        """
+        Дописывает события из очереди и останавливает поток. Вызывается при выходе из процесса.
+        """
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+        for sink in self.sinks:
+            if isinstance(sink, RotatingFileSink):
+                sink.close()
+
+
+class QueueLogger:
+    """
+    Логгер structlog: последний процессор возвращает словарь события, и он вместе с отрисовщиком
+    уходит в очередь LogWriter. Время и уровень уже добавлены процессорами в вызывающем потоке.
+    """
+
+    def __init__(self, writer: LogWriter, renderer: Callable):
+        self._writer = writer
+        self._renderer = renderer
+        for method in LOGGER_METHODS:
+            setattr(self, method, self._enqueue)
+
+    def _enqueue(self, **event_dict):
+        renderer = self._renderer
+        self._writer.put(lambda: renderer(None, "", event_dict))
+
+
+class QueueLoggerFactory:
+    def __init__(self, writer: LogWriter, renderer: Callable):
+        self.writer = writer
+        self.renderer = renderer
+
+    def __call__(self, *args) -> QueueLogger:
+        return QueueLogger(self.writer, self.renderer)
+
+
+class QueueHandler(logging.Handler):
+    """
+    Обработчик стандартного logging для сторонних библиотек: запись форматируется
+    (через structlog.stdlib.ProcessorFormatter) в фоновом потоке LogWriter.
+    """
+
+    def __init__(self, writer: LogWriter, formatter: logging.Formatter):
+        super().__init__()
+        self.writer = writer
+        self.setFormatter(formatter)
+
+    def emit(self, record: logging.LogRecord):
+        self.writer.put(lambda: self.format(record))
+
+
+_writer: Optional[LogWriter] = None
+
+
+def start_writer(stream: TextIO, file_path: str = "", max_bytes: int = 0, backups: int = 0,
+                 batch_size: int = 256, flush_interval: float = 0.5) -> LogWriter:
+    """
+    Запускает общий фоновый поток журнала (предыдущий дописывается и останавливается).
+    """
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+    # В собранном приложении без консоли sys.stdout равен None
+    sinks = [stream] if stream is not None else []
+    if file_path:
+        sinks.append(RotatingFileSink(file_path, max_bytes, backups))
+    _writer = LogWriter(sinks, batch_size, flush_interval)
+    return _writer
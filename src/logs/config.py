@@ -16,8 +16,30 @@ class LogConfig(BaseModel):
     use_colors_in_console: bool
     renderer: LogRenderer
     allow_third_party_logs: bool
+    queue: bool
+    file_path: str
+    file_max_mb: int
+    file_backups: int
+    batch_size: int
+    flush_interval: float
 
     @classmethod
     @field_validator("renderer", mode="before")
     def log_renderer_to_lower(cls, v: str):
         return v.lower()
+
+
+class MetricsExport(StrEnum):
+    NONE = auto()
+    JSONL = auto()
+    PROMETHEUS = auto()
+
+
+class MetricsConfig(BaseModel):
+    export: MetricsExport
+    path: str
+
+    @classmethod
+    @field_validator("export", mode="before")
+    def metrics_export_to_lower(cls, v: str):
+        return v.lower()
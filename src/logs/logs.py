@@ -1,66 +1,106 @@
 import logging
-from json import dumps
+import sys
+from json import JSONEncoder
 from sys import stdout
+from typing import TextIO
 
 import structlog
 from structlog import WriteLoggerFactory
 
 from src.logs.config import LogConfig, LogRenderer
 
+try:
+    import orjson
 
-def get_structlog_config(log_config: LogConfig) -> dict:
+    def _encode(value) -> str:
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    # Один кодировщик на процесс: создавать его на каждое событие дорого
+    _encode = JSONEncoder(default=str, ensure_ascii=False).encode
+
+# Ключи, которые идут первыми в JSON-записи
+FIRST_KEYS = ("level", "event")
+
+
+def configure_logging(log_config: LogConfig, stream: TextIO = stdout):
+    structlog.configure(**get_structlog_config(log_config, stream))
+
+
+def get_structlog_config(log_config: LogConfig, stream: TextIO = stdout) -> dict:
     if log_config.show_debug_logs is True:
         min_level = logging.DEBUG
     else:
         min_level = logging.INFO
 
-    if log_config.allow_third_party_logs:
-        # Create handler for stdlib logging
-        standard_handler = logging.StreamHandler(stream=stdout)
+    if log_config.queue:
+        from src.logs.backend import QueueHandler, QueueLoggerFactory, start_writer
+
+        writer = start_writer(
+            stream,
+            log_config.file_path,
+            log_config.file_max_mb * 1024 ** 2,
+            log_config.file_backups,
+            log_config.batch_size,
+            log_config.flush_interval,
+        )
+        standard_handler = QueueHandler(
+            writer, structlog.stdlib.ProcessorFormatter(processors=get_processors(log_config))
+        )
+        processors = get_processors(log_config, queue=True)
+        logger_factory = QueueLoggerFactory(writer, get_renderer(log_config))
+    else:
+        standard_handler = logging.StreamHandler(stream=stream)
         standard_handler.setFormatter(structlog.stdlib.ProcessorFormatter(processors=get_processors(log_config)))
+        processors = get_processors(log_config)
+        logger_factory = WriteLoggerFactory(file=stream)
 
+    if log_config.allow_third_party_logs:
         # Configure root logger to use this handler
         standard_logger = logging.getLogger()
         standard_logger.addHandler(standard_handler)
         standard_logger.setLevel(logging.DEBUG if log_config.show_debug_logs else logging.INFO)
 
     return {
-        "processors": get_processors(log_config),
+        "processors": processors,
         "cache_logger_on_first_use": True,
         "wrapper_class": structlog.make_filtering_bound_logger(min_level),
-        "logger_factory": WriteLoggerFactory(),
+        "logger_factory": logger_factory,
     }
 
 
-def get_processors(log_config: LogConfig) -> list:
-
-    def custom_json_serializer(
-        data,
-        *args,
-        **kwargs,
-    ):
-        result = dict()
-
-        # Set keys in specific order
-        for key in (
-            "level",
-            "event",
-        ):
-            if key in data:
-                result[key] = data.pop(key)
-
-        # Clean up non-native structlog logs:
-        if "_from_structlog" in data:
-            data.pop("_from_structlog")
-            data.pop("_record")
-
-        # Add all other fields
-        result.update(**data)
-        return dumps(
-            result,
-            default=str,
-        )
+def capture_exc_info(logger, method_name, event_dict):
+    """
+    exc_info=True раскрывается в вызывающем потоке: в фоновом потоке sys.exc_info() уже пуст.
+    """
+    if event_dict.get("exc_info") is True:
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
 
+
+def json_serializer(data, *args, **kwargs) -> str:
+    # Clean up non-native structlog logs:
+    data.pop("_from_structlog", None)
+    data.pop("_record", None)
+
+    # Ключи level и event пишутся первыми без пересборки словаря
+    head = [(key, data.pop(key)) for key in FIRST_KEYS if key in data]
+    body = _encode(data)
+    if not head:
+        return body
+    fields = ", ".join(f"{_encode(key)}: {_encode(value)}" for key, value in head)
+    return "{" + fields + (", " + body[1:] if len(body) > 2 else "}")
+
+
+def get_renderer(log_config: LogConfig):
+    if log_config.renderer == LogRenderer.JSON:
+        return structlog.processors.JSONRenderer(serializer=json_serializer)
+    return structlog.dev.ConsoleRenderer(
+        colors=log_config.use_colors_in_console,
+        pad_level=False,
+    )
+
+
+def get_processors(log_config: LogConfig, queue: bool = False) -> list:
     processors = list()
     if log_config.show_datetime is True:
         processors.append(
@@ -71,14 +111,13 @@ def get_processors(log_config: LogConfig) -> list:
         )
 
     processors.append(structlog.processors.add_log_level)
-
     if log_config.renderer == LogRenderer.JSON:
-        processors.append(structlog.processors.JSONRenderer(serializer=custom_json_serializer))
+        # Иначе exc_info попадёт в JSON строкой кортежа, без трассировки
+        processors.append(structlog.processors.dict_tracebacks)
+
+    if queue:
+        # Отрисовка переносится в фоновый поток, в вызывающем остаются только дешёвые процессоры
+        processors.append(capture_exc_info)
     else:
-        processors.append(
-            structlog.dev.ConsoleRenderer(
-                colors=log_config.use_colors_in_console,
-                pad_level=False,
-            )
-        )
+        processors.append(get_renderer(log_config))
     return processors
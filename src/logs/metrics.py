@@ -0,0 +1,297 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from src.utils.executor import JobCancelled
+
+_current_job: ContextVar[Optional["JobMetrics"]] = ContextVar("konvera_job_metrics", default=None)
+_collected_fields: ContextVar[Optional[dict]] = ContextVar("konvera_job_fields", default=None)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Пиковая память процесса с начала работы (на POSIX - с учётом завершённых дочерних процессов,
+    например ffmpeg и воркеров пула). Задачи выполняются параллельно, поэтому это пик процесса, а не задачи.
+    """
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+
+    import resource
+
+    # ru_maxrss в килобайтах на Linux и в байтах на macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * unit
+
+
+class JobMetrics:
+    """
+    Метрики одной конвертации или оптимизации: длительности этапов, размеры, кэш и скорость.
+    Текущая задача хранится в contextvars, поэтому этапы отмечаются из любой вложенной корутины.
+    """
+
+    def __init__(self, operation: str, input_path: str, **fields):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.operation = operation
+        self.input_path = input_path
+        self.output_path: Optional[str] = None
+        self.fields = fields
+        self.stages: dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def event(self, status: str, error: Optional[str] = None) -> dict:
+        duration = time.perf_counter() - self.started
+        input_size = os.path.getsize(self.input_path) if os.path.isfile(self.input_path) else None
+        output_size = None
+        if self.output_path and os.path.isfile(self.output_path):
+            output_size = os.path.getsize(self.output_path)
+
+        event = {
+            "job_id": self.job_id,
+            "operation": self.operation,
+            "input": self.input_path,
+            "output": self.output_path,
+            "status": status,
+            "seconds": round(duration, 4),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "input_size": input_size,
+            "output_size": output_size,
+            "peak_rss_bytes": peak_rss_bytes(),
+            **self.fields,
+        }
+        # Скорость считается по этапу кодирования, если он был, иначе по всей задаче
+        busy = self.stages.get("encode") or duration
+        for unit in ("frames", "pages"):
+            if self.fields.get(unit) and busy > 0:
+                event[f"{unit}_per_s"] = round(self.fields[unit] / busy, 2)
+        if error is not None:
+            event["error"] = error
+        return event
+
+
+def current_job() -> Optional[JobMetrics]:
+    return _current_job.get()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Отмечает этап текущей задачи. Вне track_job ничего не делает.
+    """
+    job = _current_job.get()
+    if job is None:
+        yield
+        return
+    with job.stage(name):
+        yield
+
+
+def annotate(**fields):
+    """
+    Добавляет поля к событию текущей задачи, например frames, pages или cache.
+    """
+    job = _current_job.get()
+    if job is not None:
+        job.fields.update(fields)
+
+
+@contextmanager
+def collect_fields(target: dict):
+    """
+    Поля задач, завершённых внутри блока (annotate), копируются в target, чтобы вызывающий код,
+    например очередь, узнал, как прошла задача: взят ли результат из кэша, перекодировалось ли видео.
+    """
+    token = _collected_fields.set(target)
+    try:
+        yield target
+    finally:
+        _collected_fields.reset(token)
+
+
+@contextmanager
+def track_job(operation: str, input_path: str, **fields):
+    """
+    Оборачивает задачу: по завершении пишет событие "job finished" в лог и выгружает метрики.
+    Вложенные задачи (например, копирование из кэша внутри конвертации) отдельного события не создают.
+    """
+    if _current_job.get() is not None:
+        yield _current_job.get()
+        return
+
+    job = JobMetrics(operation, input_path, **fields)
+    token = _current_job.set(job)
+    status, error = "done", None
+    try:
+        yield job
+    except BaseException as e:
+        status = "failed" if isinstance(e, Exception) and not isinstance(e, JobCancelled) else "cancelled"
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        _current_job.reset(token)
+        collected = _collected_fields.get()
+        if collected is not None:
+            collected.update(job.fields)
+        # structlog и конфигурация импортируются только после первой задачи, не при запуске
+        import structlog
+
+        logger = structlog.get_logger("konvera.metrics")
+        event = job.event(status, error)
+        if status == "done":
+            logger.info("job finished", **event)
+        else:
+            logger.warning("job finished", **event)
+        exporter = get_metrics_exporter()
+        if exporter is not None:
+            exporter.export(event)
+
+
+class JsonlExporter:
+    """
+    Дописывает событие каждой задачи строкой JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, event: dict):
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class PrometheusExporter:
+    """
+    Накопленные счётчики в текстовом формате Prometheus (для textfile collector node_exporter).
+    Файл перезаписывается целиком через временный файл, поэтому сборщик не видит его наполовину записанным.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.jobs: dict[tuple[str, str], int] = {}
+        self.seconds: dict[str, float] = {}
+        self.stage_seconds: dict[tuple[str, str], float] = {}
+        self.bytes_in: dict[str, int] = {}
+        self.bytes_out: dict[str, int] = {}
+        self.cache: dict[str, int] = {}
+        self.peak_rss = 0
+
+    def export(self, event: dict):
+        operation = event["operation"]
+        with self._lock:
+            key = (operation, event["status"])
+            self.jobs[key] = self.jobs.get(key, 0) + 1
+            self.seconds[operation] = self.seconds.get(operation, 0.0) + event["seconds"]
+            for name, seconds in event["stages"].items():
+                self.stage_seconds[(operation, name)] = self.stage_seconds.get((operation, name), 0.0) + seconds
+            self.bytes_in[operation] = self.bytes_in.get(operation, 0) + (event["input_size"] or 0)
+            self.bytes_out[operation] = self.bytes_out.get(operation, 0) + (event["output_size"] or 0)
+            if event.get("cache"):
+                self.cache[event["cache"]] = self.cache.get(event["cache"], 0) + 1
+            self.peak_rss = max(self.peak_rss, event["peak_rss_bytes"] or 0)
+            text = self.render()
+
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+
+    def render(self) -> str:
+        lines = [
+            "# TYPE konvera_jobs_total counter",
+            *(f'konvera_jobs_total{{operation="{operation}",status="{status}"}} {count}'
+              for (operation, status), count in sorted(self.jobs.items())),
+            "# TYPE konvera_job_seconds_total counter",
+            *(f'konvera_job_seconds_total{{operation="{operation}"}} {seconds:.4f}'
+              for operation, seconds in sorted(self.seconds.items())),
+            "# TYPE konvera_stage_seconds_total counter",
+            *(f'konvera_stage_seconds_total{{operation="{operation}",stage="{name}"}} {seconds:.4f}'
+              for (operation, name), seconds in sorted(self.stage_seconds.items())),
+            "# TYPE konvera_input_bytes_total counter",
+            *(f'konvera_input_bytes_total{{operation="{operation}"}} {size}'
+              for operation, size in sorted(self.bytes_in.items())),
+            "# TYPE konvera_output_bytes_total counter",
+            *(f'konvera_output_bytes_total{{operation="{operation}"}} {size}'
+              for operation, size in sorted(self.bytes_out.items())),
+            "# TYPE konvera_cache_total counter",
+            *(f'konvera_cache_total{{result="{result}"}} {count}' for result, count in sorted(self.cache.items())),
+            "# TYPE konvera_peak_rss_bytes gauge",
+            f"konvera_peak_rss_bytes {self.peak_rss}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+_exporter = None
+_exporter_ready = False
+
+
+def default_metrics_path(export) -> str:
+    from src.logs.config import MetricsExport
+    from src.tools.cache import default_cache_dir
+
+    name = "metrics.jsonl" if export == MetricsExport.JSONL else "metrics.prom"
+    return os.path.join(os.path.dirname(default_cache_dir()), name)
+
+
+def create_exporter(metrics_config):
+    from src.logs.config import MetricsExport
+
+    if metrics_config.export == MetricsExport.NONE:
+        return None
+    path = metrics_config.path or default_metrics_path(metrics_config.export)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if metrics_config.export == MetricsExport.JSONL:
+        return JsonlExporter(path)
+    return PrometheusExporter(path)
+
+
+def get_metrics_exporter():
+    """
+    Выгрузка метрик, настроенная по секции [metrics], или None, если выгрузка выключена.
+    """
+    global _exporter, _exporter_ready
+    if not _exporter_ready:
+        from src.config import config
+
+        _exporter = create_exporter(config.metrics)
+        _exporter_ready = True
+    return _exporter
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiohttp import web
+
+from src.tools.batch import BatchJob, BatchQueue, output_path_for
+from src.tools.converter import FileConverter
+from src.tools.formats import media_type
+from src.utils.executor import get_executors
+
+# Размер части, которой тело запроса пишется на диск
+UPLOAD_CHUNK = 1024 ** 2
+# Параметры оптимизации, которые принимаются из строки запроса
+OPTIMIZE_OPTIONS = {'crf': str, 'preset': str, 'quality': int, 'max_size': int, 'target_size': int}
+
+JOBS_KEY = web.AppKey("jobs", dict)
+QUEUE_KEY = web.AppKey("queue", BatchQueue)
+SETTINGS_KEY = web.AppKey("settings", object)
+DIRECTORY_KEY = web.AppKey("directory", str)
+
+
+@dataclass
+class ServerJob:
+    """
+    Задача, принятая сервером: загруженный файл лежит в своей папке directory, там же пишется результат.
+    """
+    id: str
+    job: BatchJob
+    directory: str
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: int = 0
+    total: int = 0
+    task: Optional[asyncio.Task] = None
+
+    def set_progress(self, done: int, total: int):
+        # Вызывается из потоков пула: присваивание атрибутов не требует блокировки
+        self.done, self.total = done, total
+
+    def as_dict(self) -> dict:
+        job = self.job
+        result = {
+            "id": self.id,
+            "action": job.action,
+            "target_format": job.target_format,
+            "input": os.path.basename(job.input_path),
+            "status": job.status,
+            "error": job.error,
+            "progress": round(self.done / self.total, 4) if self.total else None,
+            "seconds": round(job.duration, 3) if job.duration is not None else None,
+            "input_size": os.path.getsize(job.input_path) if os.path.isfile(job.input_path) else None,
+        }
+        if job.status == 'done' and job.result:
+            result["result"] = f"/jobs/{self.id}/result"
+            if os.path.isdir(job.result):
+                result["files"] = sorted(os.listdir(job.result))
+            elif os.path.isfile(job.result):
+                result["output_size"] = os.path.getsize(job.result)
+        return result
+
+
+def upload_name(request: web.Request) -> str:
+    """
+    Имя загружаемого файла из параметра name. От пути остаётся только имя, чтобы файл не вышел из папки задачи.
+    """
+    name = os.path.basename(request.query.get("name", "").replace("\\", "/"))
+    if not name or name in (".", ".."):
+        raise web.HTTPBadRequest(text="Укажите имя файла в параметре name.")
+    if media_type(name) is None:
+        raise web.HTTPUnsupportedMediaType(text=f"Формат файла {name} не поддерживается.")
+    return name
+
+
+async def receive_file(request: web.Request, path: str, max_size: int) -> int:
+    """
+    Пишет тело запроса в path частями по мере получения, не накапливая его в памяти.
+    """
+    executors = get_executors()
+    if request.content_length is not None and max_size and request.content_length > max_size:
+        raise web.HTTPRequestEntityTooLarge(max_size=max_size, actual_size=request.content_length)
+
+    size = 0
+    f = await executors.run_in_thread(open, path, "wb")
+    try:
+        async for chunk in request.content.iter_chunked(UPLOAD_CHUNK):
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise web.HTTPRequestEntityTooLarge(max_size=max_size, actual_size=size)
+            await executors.run_in_thread(f.write, chunk)
+    finally:
+        await executors.run_in_thread(f.close)
+    if not size:
+        raise web.HTTPBadRequest(text="Пустой файл.")
+    return size
+
+
+def get_job(request: web.Request) -> ServerJob:
+    job = request.app[JOBS_KEY].get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="Задача не найдена.")
+    return job
+
+
+async def create_job(request: web.Request) -> web.Response:
+    """
+    POST /jobs?action=convert&format=.mp4&name=video.mov - тело запроса - сам файл.
+    Для action=optimize принимаются crf, preset, quality, max_size, target_size.
+    """
+    action = request.query.get("action", "convert")
+    if action not in ("convert", "optimize"):
+        raise web.HTTPBadRequest(text=f"Неизвестное действие {action}.")
+    target_format = None
+    if action == "convert":
+        target_format = request.query.get("format", "").lower()
+        if not target_format:
+            raise web.HTTPBadRequest(text="Для конвертации нужен параметр format.")
+        if not target_format.startswith("."):
+            target_format = "." + target_format
+
+    options = {}
+    for key, convert in OPTIMIZE_OPTIONS.items():
+        if key in request.query:
+            try:
+                options[key] = convert(request.query[key])
+            except ValueError:
+                raise web.HTTPBadRequest(text=f"Неверное значение {key}.")
+    if "strip_metadata" in request.query:
+        options["strip_metadata"] = request.query["strip_metadata"].lower() in ("1", "true", "yes")
+
+    name = upload_name(request)
+    if target_format is not None and target_format not in await FileConverter(name).get_available_formats():
+        raise web.HTTPUnprocessableEntity(text=f"Конвертация {name} в формат {target_format} не поддерживается.")
+
+    settings = request.app[SETTINGS_KEY]
+    job_id = uuid.uuid4().hex
+    directory = os.path.join(request.app[DIRECTORY_KEY], job_id)
+    await get_executors().run_in_thread(os.makedirs, directory)
+    input_path = os.path.join(directory, name)
+    try:
+        await receive_file(request, input_path, settings.max_upload_mb * 1024 ** 2)
+    except BaseException:
+        await get_executors().run_in_thread(shutil.rmtree, directory, True)
+        raise
+
+    job = BatchJob(input_path, action, target_format, options=options)
+    job.output_path = output_path_for(job, os.path.join(directory, "result"))
+    os.makedirs(os.path.dirname(job.output_path), exist_ok=True)
+    server_job = ServerJob(job_id, job, directory)
+    job.progress = server_job.set_progress
+    request.app[JOBS_KEY][job_id] = server_job
+    server_job.task = asyncio.ensure_future(run_job(request.app, server_job))
+    return web.json_response(server_job.as_dict(), status=202, headers={"Location": f"/jobs/{job_id}"})
+
+
+async def run_job(app: web.Application, server_job: ServerJob):
+    try:
+        await app[QUEUE_KEY].execute(server_job.job)
+    finally:
+        server_job.finished_at = time.time()
+
+
+async def job_status(request: web.Request) -> web.Response:
+    return web.json_response(get_job(request).as_dict())
+
+
+async def job_result(request: web.Request) -> web.StreamResponse:
+    """
+    Результат задачи. Файл отдаётся через sendfile, без чтения в память.
+    Если результат - папка (например, страницы PDF), отдаётся список файлов, каждый доступен по /result/{имя}.
+    """
+    server_job = get_job(request)
+    job = server_job.job
+    if job.status != 'done' or not job.result:
+        raise web.HTTPConflict(text=f"Результат не готов: {job.status}.")
+
+    path = job.result
+    name = request.match_info.get("name")
+    if os.path.isdir(path):
+        if name is None:
+            return web.json_response({"files": sorted(os.listdir(path))})
+        path = os.path.join(path, os.path.basename(name))
+    elif name is not None:
+        raise web.HTTPNotFound()
+    if not os.path.isfile(path):
+        raise web.HTTPNotFound(text="Файл результата не найден.")
+    return web.FileResponse(path, headers={
+        "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"',
+    })
+
+
+async def delete_job(request: web.Request) -> web.Response:
+    """
+    Отменяет задачу, если она ещё выполняется, и удаляет её файлы.
+    """
+    server_job = request.app[JOBS_KEY].pop(request.match_info["job_id"], None)
+    if server_job is None:
+        raise web.HTTPNotFound(text="Задача не найдена.")
+    await discard_job(server_job)
+    return web.json_response({"id": server_job.id, "status": "deleted"})
+
+
+async def discard_job(server_job: ServerJob):
+    if server_job.task is not None and not server_job.task.done():
+        server_job.task.cancel()
+        try:
+            await server_job.task
+        except asyncio.CancelledError:
+            pass
+    await get_executors().run_in_thread(shutil.rmtree, server_job.directory, True)
+
+
+async def list_jobs(request: web.Request) -> web.Response:
+    return web.json_response([job.as_dict() for job in request.app[JOBS_KEY].values()])
+
+
+async def available_formats(request: web.Request) -> web.Response:
+    """
+    GET /formats?name=video.mov - форматы, в которые можно конвертировать файл с таким расширением.
+    """
+    name = upload_name(request)
+    return web.json_response({"formats": await FileConverter(name).get_available_formats()})
+
+
+async def health(request: web.Request) -> web.Response:
+    jobs = request.app[JOBS_KEY].values()
+    return web.json_response({
+        "status": "ok",
+        "jobs": len(jobs),
+        "running": sum(job.job.status == 'running' for job in jobs),
+    })
+
+
+async def expire_jobs(app: web.Application):
+    """
+    Периодически удаляет завершённые задачи старше result_ttl секунд вместе с файлами.
+    """
+    ttl = app[SETTINGS_KEY].result_ttl
+    while True:
+        await asyncio.sleep(max(min(ttl / 4, 300), 1))
+        now = time.time()
+        expired = [
+            job_id for job_id, job in app[JOBS_KEY].items()
+            if job.finished_at is not None and now - job.finished_at > ttl
+        ]
+        for job_id in expired:
+            await discard_job(app[JOBS_KEY].pop(job_id))
+
+
+async def background_tasks(app: web.Application):
+    cleanup = asyncio.ensure_future(expire_jobs(app)) if app[SETTINGS_KEY].result_ttl else None
+    yield
+    if cleanup is not None:
+        cleanup.cancel()
+    for server_job in list(app[JOBS_KEY].values()):
+        await discard_job(server_job)
+    app[JOBS_KEY].clear()
+    if app[SETTINGS_KEY].directory == "":
+        # Временная папка сервера создана им самим
+        await get_executors().run_in_thread(shutil.rmtree, app[DIRECTORY_KEY], True)
+
+
+def create_app(settings=None, queue: Optional[BatchQueue] = None) -> web.Application:
+    """
+    Приложение aiohttp с API конвертации и сжатия. settings - секция [server] (по умолчанию из конфигурации).
+    Задачи выполняются через общую очередь BatchQueue и общие пулы исполнителей.
+    """
+    if settings is None:
+        from src.config import config
+
+        settings = config.server
+
+    # Тело запроса читается потоком, поэтому ограничение aiohttp на размер в памяти не применяется
+    app = web.Application(client_max_size=0)
+    app[SETTINGS_KEY] = settings
+    app[JOBS_KEY] = {}
+    app[QUEUE_KEY] = queue or BatchQueue(max_jobs=settings.max_jobs or None)
+    directory = settings.directory or tempfile.mkdtemp(prefix="konvera-server-")
+    os.makedirs(directory, exist_ok=True)
+    app[DIRECTORY_KEY] = directory
+
+    app.router.add_get("/health", health)
+    app.router.add_get("/formats", available_formats)
+    app.router.add_get("/jobs", list_jobs)
+    app.router.add_post("/jobs", create_job)
+    app.router.add_get("/jobs/{job_id}", job_status)
+    app.router.add_delete("/jobs/{job_id}", delete_job)
+    app.router.add_get("/jobs/{job_id}/result", job_result)
+    app.router.add_get("/jobs/{job_id}/result/{name}", job_result)
+    app.cleanup_ctx.append(background_tasks)
+    return app
+
+
+async def serve(host: Optional[str] = None, port: Optional[int] = None, settings=None):
+    """
+    Запускает сервер и работает до отмены.
+    """
+    app = create_app(settings)
+    settings = app[SETTINGS_KEY]
+    runner = web.AppRunner(app)
+    await runner.setup()
+    host, port = host or settings.host, port or settings.port
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    import structlog
+
+    structlog.get_logger().info("Server started", host=host, port=port, directory=app[DIRECTORY_KEY])
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
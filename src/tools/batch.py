@@ -0,0 +1,226 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from src.logs.metrics import collect_fields
+from src.tools.converter import FileConverter
+from src.tools.formats import media_type
+from src.tools.optimize import FileOptimizer
+from src.tools.scheduler import CostScheduler, JobEstimate, get_scheduler
+from src.utils.executor import get_executors
+from src.utils.progress import ProgressCallback
+
+
+@dataclass
+class BatchJob:
+    """
+    Задача пакетной обработки: конвертация в target_format или оптимизация одного файла.
+    """
+    input_path: str
+    action: str  # 'convert' или 'optimize'
+    target_format: Optional[str] = None
+    output_path: Optional[str] = None
+    options: dict = field(default_factory=dict)
+    status: str = 'pending'  # pending, running, done, skipped, failed, cancelled
+    result: Optional[str] = None
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Optional[ProgressCallback] = field(default=None, repr=False, compare=False)
+    # Поля метрик выполненной задачи (annotate): cache, reencoded, frames и т. п.
+    fields: dict = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def media_type(self):
+        return media_type(self.input_path)
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+def collect_files(paths: Iterable[str], recursive: bool = True) -> list[str]:
+    """
+    Раскрывает папки в списке путей и оставляет только файлы поддерживаемых форматов.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if media_type(name))
+                if not recursive:
+                    break
+        elif os.path.isfile(path) and media_type(path):
+            files.append(path)
+    return files
+
+
+def output_path_for(job: BatchJob, output_dir: Optional[str]) -> Optional[str]:
+    """
+    Путь результата в output_dir. Без output_dir инструменты пишут результат рядом с исходником.
+    """
+    if output_dir is None:
+        return None
+    base, ext = os.path.splitext(os.path.basename(job.input_path))
+    if job.action == 'convert':
+        return os.path.join(output_dir, base + job.target_format)
+    return os.path.join(output_dir, base + '_optimized' + ext)
+
+
+class BatchQueue:
+    """
+    Очередь пакетной обработки файлов.
+    Задачи выполняются параллельно с отдельным ограничением для каждого типа медиа:
+    видеокодеки сами занимают много ядер, а изображения можно обрабатывать широко.
+    Планировщик ([scheduler]) оценивает стоимость каждой задачи, задаёт порядок запуска
+    и не даёт одновременно идущим задачам превысить бюджет ядер и памяти.
+    """
+
+    def __init__(self, limits: Optional[dict] = None, max_jobs: Optional[int] = None,
+                 scheduler: Optional[CostScheduler] = None):
+        if limits is None or max_jobs is None:
+            from src.config import config
+
+            limits = limits if limits is not None else {
+                'video': config.batch.video,
+                'image': config.batch.image,
+                'document': config.batch.document,
+            }
+            max_jobs = max_jobs if max_jobs is not None else config.batch.max_jobs
+
+        cpu_count = os.cpu_count() or 1
+        self.limits = {kind: limit or cpu_count for kind, limit in limits.items()}
+        self.max_jobs = max_jobs or sum(self.limits.values())
+        self.jobs: list[BatchJob] = []
+        self._total_limit = asyncio.Semaphore(self.max_jobs)
+        self._type_limits = {kind: asyncio.Semaphore(limit) for kind, limit in self.limits.items()}
+        self._scheduler = scheduler
+
+    def add(self, job: BatchJob) -> BatchJob:
+        if job.media_type not in self.limits:
+            raise ValueError(f"Неподдерживаемый тип файла {job.input_path}.")
+        self.jobs.append(job)
+        return job
+
+    def add_files(self, paths: Iterable[str], action: str, target_format: Optional[str] = None,
+                  output_dir: Optional[str] = None, **options) -> list[BatchJob]:
+        """
+        Добавляет задачи для файлов и папок из paths.
+        """
+        if action not in ('convert', 'optimize'):
+            raise ValueError(f"Неизвестное действие {action}.")
+        if action == 'convert' and not target_format:
+            raise ValueError("Для конвертации нужен целевой формат.")
+
+        jobs = []
+        for path in collect_files(paths):
+            job = BatchJob(path, action, target_format.lower() if target_format else None, options=options)
+            job.output_path = output_path_for(job, output_dir)
+            jobs.append(self.add(job))
+        return jobs
+
+    @property
+    def scheduler(self) -> Optional[CostScheduler]:
+        if self._scheduler is None:
+            self._scheduler = get_scheduler()
+        return self._scheduler
+
+    async def run(self, on_job_done: Optional[Callable[[BatchJob], None]] = None,
+                  policy: Optional[str] = None) -> list[BatchJob]:
+        """
+        Выполняет все ожидающие задачи и возвращает их список.
+        on_job_done вызывается в цикле событий после завершения каждой задачи.
+        policy - порядок запуска: 'lpt' (сначала длинные, меньше общее время) или 'sjf'
+        (сначала короткие, первые результаты быстрее); по умолчанию [scheduler] batch_policy.
+        """
+        async def worker(job: BatchJob, estimate: Optional[JobEstimate]):
+            await self.execute(job, policy, estimate)
+            if on_job_done is not None:
+                on_job_done(job)
+
+        pending = [job for job in self.jobs if job.status == 'pending']
+        scheduler = self.scheduler
+        if scheduler is None:
+            await asyncio.gather(*(worker(job, None) for job in pending))
+            return self.jobs
+
+        if policy is None:
+            from src.config import config
+
+            policy = config.scheduler.batch_policy
+        estimates = await scheduler.estimate_all(pending)
+        # Семафоры типов пропускают задачи в порядке ожидания, поэтому порядок создания задач - порядок запуска
+        order = scheduler.order(estimates, policy)
+        try:
+            await asyncio.gather(*(worker(pending[index], estimates[index]) for index in order))
+        finally:
+            await get_executors().run_in_thread(scheduler.model.save)
+        return self.jobs
+
+    async def execute(self, job: BatchJob, policy: Optional[str] = None,
+                      estimate: Optional[JobEstimate] = None) -> BatchJob:
+        """
+        Выполняет одну задачу в пределах ограничений очереди, не добавляя её в jobs.
+        Подходит для задач, которые поступают постепенно (режим наблюдения за папками, сервер):
+        по умолчанию ожидающие задачи допускаются по [scheduler] interactive_policy.
+        """
+        scheduler = self.scheduler
+        if scheduler is None:
+            async with self._type_limits[job.media_type], self._total_limit:
+                await self._run_job(job)
+            return job
+
+        if policy is None:
+            from src.config import config
+
+            policy = config.scheduler.interactive_policy
+        if estimate is None:
+            estimate = await get_executors().run_in_thread(scheduler.estimate, job)
+        # Бюджет занимается только задачей, уже прошедшей предел своего типа: иначе видео, ждущее семафора,
+        # держало бы ядра, нужные изображениям за ним
+        async with self._type_limits[job.media_type], self._total_limit, scheduler.slot(estimate, policy):
+            await self._run_job(job)
+        if job.status == 'done':
+            scheduler.learn(estimate, job.duration, job.fields)
+            await get_executors().run_in_thread(scheduler.model.save, False)
+        return job
+
+    @staticmethod
+    async def _run_job(job: BatchJob):
+        job.status = 'running'
+        job.started_at = time.perf_counter()
+        try:
+            if job.output_path is not None:
+                os.makedirs(os.path.dirname(job.output_path) or '.', exist_ok=True)
+
+            if job.action == 'convert':
+                converter = FileConverter(job.input_path)
+                if job.target_format not in await converter.get_available_formats():
+                    job.status = 'skipped'
+                    job.error = f"Конвертация в формат {job.target_format} не поддерживается."
+                    return
+                with collect_fields(job.fields):
+                    job.result = await converter.convert_to_format(job.target_format, job.output_path, job.progress)
+            else:
+                if not FileOptimizer.is_format_supported(os.path.splitext(job.input_path)[1]):
+                    job.status = 'skipped'
+                    job.error = "Формат файла не поддерживается для оптимизации."
+                    return
+                with collect_fields(job.fields):
+                    job.result = await FileOptimizer.optimize_file(
+                        job.input_path, job.output_path, job.progress, **job.options
+                    )
+            job.status = 'done'
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.perf_counter()
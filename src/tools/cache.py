@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from typing import Awaitable, Callable, Optional
+
+from src.logs.metrics import annotate, stage
+from src.utils.executor import get_executors
+from src.utils.materialize import materialize_file
+from src.utils.progress import ProgressCallback, report
+
+# Меняется, когда результаты инструментов перестают совпадать с сохранёнными ранее
+CACHE_VERSION = 1
+# До какой доли max_size очищается переполненный кэш
+LOW_WATER = 0.9
+
+
+def default_cache_dir() -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "konvera", "results")
+
+
+class ResultCache:
+    """
+    Кэш результатов конвертации и оптимизации на диске.
+    Ключ - хэш содержимого исходного файла вместе с операцией и её параметрами.
+    Время изменения записи обновляется при каждом попадании, при превышении max_size
+    удаляются записи, которые дольше всего не использовались, пока кэш не станет меньше LOW_WATER от max_size.
+    Запись и выданный из неё результат - независимые файлы (reflink или копия): инструменты перезаписывают
+    результат на месте, и общая с записью жёсткая ссылка испортила бы кэш.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        # Размер кэша: считается обходом папки при первой записи, дальше обновляется при каждой записи
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "blake2b").hexdigest()
+
+    @staticmethod
+    def key(source_hash: str, operation: str, params: dict) -> str:
+        payload = json.dumps([CACHE_VERSION, source_hash, operation, params], sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+    def entry_path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """
+        Записывает результат из кэша в output_path. Возвращает False, если записи нет.
+        """
+        entry = self.entry_path(key, os.path.splitext(output_path)[1].lower())
+        try:
+            os.utime(entry)
+            materialize_file(entry, output_path)
+        except FileNotFoundError:
+            # Запись удалена (в том числе вытеснена другой задачей между проверкой и копированием) - промах
+            return False
+        return True
+
+    def store(self, key: str, result_path: str):
+        """
+        Сохраняет результат в кэш и при необходимости освобождает место.
+        """
+        if not os.path.isfile(result_path) or os.path.getsize(result_path) > self.max_size:
+            return
+        entry = self.entry_path(key, os.path.splitext(result_path)[1].lower())
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        materialize_file(result_path, entry)
+        size = os.path.getsize(entry)
+        with self._lock:
+            if self._size is None:
+                self._size = self.scan()[1]
+            else:
+                self._size += size
+            if self._size <= self.max_size:
+                return
+            self.evict()
+
+    def scan(self) -> tuple[list, int]:
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """
+        Удаляет давно не использованные записи с запасом до LOW_WATER, чтобы следующие записи
+        не обходили папку снова. Вызывается под self._lock.
+        """
+        entries, total = self.scan()
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size * LOW_WATER:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Кэш, настроенный по секции [cache] конфигурации, или None, если кэш выключен.
+    """
+    global _result_cache
+    from src.config import config
+
+    if not config.cache.enabled:
+        return None
+    if _result_cache is None:
+        _result_cache = ResultCache(config.cache.directory or default_cache_dir(), config.cache.max_size_mb * 1024 ** 2)
+    return _result_cache
+
+
+async def run_cached(operation: str, input_path: str, output_path: str, params: dict,
+                     produce: Callable[[], Awaitable[str]], progress: ProgressCallback = None) -> str:
+    """
+    Возвращает результат из кэша или вызывает produce и сохраняет то, что она записала.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return await produce()
+
+    executors = get_executors()
+    with stage("hash"):
+        source_hash = await executors.run_in_thread(cache.file_hash, input_path)
+    key = cache.key(source_hash, operation, params)
+    with stage("write"):
+        hit = await executors.run_in_thread(cache.fetch, key, output_path)
+    annotate(cache="hit" if hit else "miss")
+    if hit:
+        report(progress, 1, 1)
+        return output_path
+
+    result = await produce()
+    with stage("cache_store"):
+        await executors.run_in_thread(cache.store, key, result)
+    return result
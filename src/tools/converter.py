@@ -1,14 +1,29 @@
 import asyncio
 import os
+import shutil
+import tempfile
 
-import imageio
-from docx2pdf import convert as docx2pdf_convert
-from pdf2docx import Converter
+from src.logs.metrics import annotate, stage, track_job
+from src.tools.cache import run_cached
+from src.tools.formats import (
+    Step, conversion_graph, image_formats, page_archive_formats, register_backend, video_formats,
+)
+from src.utils.executor import CancelToken, get_executors
+from src.utils.materialize import async_materialize_file
+from src.utils.progress import ProgressCallback, report
 
-from src.utils.async_copy_file import async_copy_file
+# Шаг цепочки получает свою долю общего прогресса
+PROGRESS_SCALE = 1000
 
 
 class FileConverter:
+    """
+    Конвертация файла в другой формат.
+    Способы конвертации регистрируются в графе форматов (src.tools.formats), и для каждой пары
+    выбирается самая дешёвая цепочка, при необходимости через промежуточные форматы.
+    Библиотеки конкретных форматов (pyav, pdf2docx, docx2pdf, PyMuPDF) импортируются
+    при первой конвертации соответствующего типа, чтобы не замедлять запуск.
+    """
     def __init__(self, file_path: str):
         self.file_path = file_path
         self.base, self.extension = os.path.splitext(file_path)
@@ -17,86 +32,309 @@ class FileConverter:
     async def get_available_formats(self):
         """
         Асинхронно определяет, в какие форматы возможно конвертировать данный файл.
-        Возвращаются допустимые расширения для видео, изображений и документов.
         """
-        video_formats = ['.mp4', '.avi', '.mkv', '.mov']
-        image_formats = ['.jpg', '.jpeg', '.png', '.gif']
-        document_formats = ['.doc', '.docx', '.pdf']
-        if self.extension in video_formats:
-            video_formats.remove(self.extension)
-            return video_formats
-        elif self.extension in image_formats:
-            image_formats.remove(self.extension)
-            return image_formats
-        elif self.extension in document_formats:
-            if self.extension in ['.doc', '.docx']:
-                formats = ['.docx', '.pdf']
-                formats.remove(self.extension)
-                return formats
-            elif self.extension == '.pdf':
-                formats = ['.pdf', '.docx']
-                formats.remove(self.extension)
-                return formats
-        return []
-
-    async def convert_to_format(self, target_format: str, output_file: str = None):
+        return conversion_graph().targets(self.extension)
+
+    async def convert_to_format(self, target_format: str, output_file: str = None,
+                                progress: ProgressCallback = None):
         """
         Асинхронно конвертирует исходный файл в указанный формат.
+        progress получает (сделано, всего): кадры для видео, страницы для PDF, байты для копирования.
+        Возвращает путь к результату: для PDF из нескольких страниц в PNG/JPG это папка со страницами.
         """
         target_format = target_format.lower()
-        available = await self.get_available_formats()
-        if target_format not in available:
+        if self.extension == target_format:
+            return self.file_path
+
+        plan = conversion_graph().plan(self.extension, target_format)
+        if plan is None:
             raise ValueError(f"Конвертация в формат {target_format} не поддерживается для файла {self.file_path}.")
 
         if output_file is None:
             output_file = self.base + target_format
 
-        if self.extension == target_format:
-            return self.file_path
+        with track_job('convert', self.file_path, target_format=target_format) as job:
+            job.output_path = output_file
+            annotate(plan=[step.backend.name for step in plan])
+            # Простое копирование дешевле хэширования, его нет смысла кэшировать
+            if not any(step.backend.cacheable for step in plan):
+                return await run_plan(plan, self.file_path, output_file, progress)
+
+            params = {'format': target_format}
+            for step in plan:
+                if step.backend.cache_params is not None:
+                    params[step.backend.name] = step.backend.cache_params()
+            return await run_cached(
+                'convert', self.file_path, output_file, params,
+                lambda: run_plan(plan, self.file_path, output_file, progress), progress,
+            )
+
+    async def extract_frames(self, output_dir: str = None, count: int = None, width: int = None,
+                             keyframes_only: bool = None, progress: ProgressCallback = None) -> list[str]:
+        """
+        Асинхронно сохраняет count кадров видео, равномерно распределённых по нему, в JPG в output_dir
+        (по умолчанию - папка рядом с файлом с суффиксом _frames). Неуказанные параметры берутся из [frames].
+        """
+        from src.config import config
+        from src.tools.keyframes import save_frames
+
+        if self.extension not in video_formats:
+            raise ValueError(f"Извлечение кадров поддерживается только для видео, а не {self.file_path}.")
+        settings = config.frames
+        with track_job('frames', self.file_path) as job:
+            job.output_path = output_dir = output_dir or self.base + '_frames'
+            count = count or settings.count
+            annotate(frames=count)
+            # pyav декодирует без GIL, а прогресс передаётся только внутри процесса
+            with stage("decode"):
+                return await get_executors().run_in_thread(
+                    save_frames, self.file_path, output_dir, count, width or settings.width,
+                    settings.keyframes_only if keyframes_only is None else keyframes_only, settings.jpeg_quality,
+                    progress=progress, cancellable=True,
+                )
+
 
-        video_formats = ['.mp4', '.avi', '.mkv', '.mov']
-        if self.extension in video_formats:
-            await asyncio.to_thread(self._convert_video, output_file)
-            return output_file
-
-        image_formats = ['.jpg', '.jpeg', '.png', '.gif']
-        if self.extension in image_formats:
-            await asyncio.to_thread(self._convert_image, output_file)
-            return output_file
-
-        document_formats = ['.doc', '.docx', '.pdf']
-        if self.extension in document_formats:
-            if self.extension in ['.doc', '.docx'] and target_format == '.pdf':
-                await asyncio.to_thread(docx2pdf_convert, self.file_path, output_file)
-                return output_file
-            elif self.extension == '.pdf' and target_format == '.docx':
-                await asyncio.to_thread(self._convert_pdf_to_docx, output_file)
-                return output_file
+async def run_plan(plan: tuple[Step, ...], input_path: str, output_path: str,
+                   progress: ProgressCallback = None) -> str:
+    """
+    Выполняет цепочку конвертаций. Промежуточные файлы создаются во временной папке рядом с результатом
+    и удаляются после последнего шага. Возвращает путь к результату последнего шага.
+    """
+    if len(plan) == 1:
+        return await plan[0].backend.convert(input_path, output_path, progress) or output_path
+
+    executors = get_executors()
+    workdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix=".konvera-convert-")
+    try:
+        source = input_path
+        for index, step in enumerate(plan):
+            if index == len(plan) - 1:
+                target = output_path
             else:
-                await async_copy_file(self.file_path, output_file)
-                return output_file
-
-        raise ValueError("Неизвестный тип файла для конвертации.")
-
-    def _convert_video(self, output_file: str):
-        reader = imageio.get_reader(self.file_path)
-        meta_data = reader.get_meta_data()
-        fps = meta_data.get('fps', 25)
-        writer = imageio.get_writer(output_file, fps=fps)
-        try:
-            for frame in reader:
-                writer.append_data(frame)
-        finally:
-            writer.close()
-            reader.close()
-
-    def _convert_image(self, output_file: str):
-        img = imageio.imread(self.file_path)
-        imageio.imwrite(output_file, img)
-
-    def _convert_pdf_to_docx(self, output_file: str):
-        cv = Converter(self.file_path)
-        try:
-            cv.convert(output_file, start=0, end=None)
-        finally:
-            cv.close()
+                target = os.path.join(workdir, f"step{index}{step.target}")
+            source = await step.backend.convert(source, target, step_progress(progress, index, len(plan))) or target
+    finally:
+        await executors.run_in_thread(shutil.rmtree, workdir, True)
+    return source
+
+
+def step_progress(progress: ProgressCallback, index: int, steps: int) -> ProgressCallback:
+    if progress is None:
+        return None
+
+    def callback(done: int, total: int):
+        fraction = done / total if total else 0
+        report(progress, int((index + fraction) * PROGRESS_SCALE), steps * PROGRESS_SCALE)
+    return callback
+
+
+@register_backend('remux', video_formats, video_formats, cost=1)
+async def remux_video(input_path: str, output_path: str, progress: ProgressCallback = None):
+    # Перепаковка без перекодирования не разделяется на этапы: пакеты копируются по одному
+    with stage("encode"):
+        await get_executors().run_in_thread(_remux_video, input_path, output_path, progress=progress, cancellable=True)
+
+
+def _remux_video(input_path: str, output_path: str, progress: ProgressCallback = None, cancel: CancelToken = None):
+    """
+    Перепаковывает видео в новый контейнер, перекодируя только несовместимые потоки.
+    Если копирование пакетов не удалось, все потоки перекодируются.
+    """
+    import av
+
+    from src.tools.remux import VideoRemuxer
+
+    try:
+        VideoRemuxer.remux(input_path, output_path, cancel=cancel, progress=progress)
+    except av.FFmpegError:
+        VideoRemuxer.remux(input_path, output_path, force_transcode=True, cancel=cancel, progress=progress)
+
+
+def animation_settings() -> dict:
+    from src.config import config
+
+    return config.animation.model_dump()
+
+
+@register_backend('video_to_animation', video_formats, ['.gif'], cost=5, intermediate=False,
+                  cache_params=animation_settings)
+@register_backend('animation_to_video', ['.gif'], video_formats, cost=4, intermediate=False)
+async def convert_frames(input_path: str, output_path: str, progress: ProgressCallback = None):
+    """
+    Конвертация между анимацией и видео (GIF <-> видео, GIF -> APNG) потоково через ffmpeg.
+    """
+    from src.tools import frames
+    from src.tools.probe import probe_media
+
+    executors = get_executors()
+    with stage("probe"):
+        info = await executors.run_in_thread(probe_media, input_path)
+    total_frames = info.video.frames if info.video else 0
+    options = {}
+    if os.path.splitext(output_path)[1].lower() in frames.VIDEO_CODECS:
+        convert = frames.animation_to_video
+    else:
+        from src.config import config
+
+        convert = frames.video_to_animation
+        settings = config.animation
+        options['max_width'] = settings.max_width
+        if settings.max_fps and info.video and info.video.fps > settings.max_fps:
+            options['fps'] = settings.max_fps
+            # Прогресс считается по кадрам результата
+            total_frames = int(total_frames * settings.max_fps / info.video.fps)
+    annotate(frames=total_frames)
+    with stage("encode"):
+        await executors.run_in_thread(
+            convert, input_path, output_path, total_frames, progress=progress, cancellable=True, **options
+        )
+
+
+def frames_settings() -> dict:
+    from src.config import config
+
+    return config.frames.model_dump()
+
+
+@register_backend('contact_sheet', video_formats, ['.jpg', '.jpeg', '.png'], cost=2, intermediate=False,
+                  cache_params=frames_settings)
+async def make_contact_sheet(input_path: str, output_path: str, progress: ProgressCallback = None):
+    """
+    Лист кадров видео по [frames]: декодируются только кадры у выбранных моментов, а не всё видео.
+    """
+    from src.config import config
+    from src.tools import keyframes
+
+    settings = config.frames
+    annotate(frames=settings.count)
+    with stage("decode"):
+        await get_executors().run_in_thread(
+            keyframes.make_contact_sheet, input_path, output_path, settings.count, settings.columns, settings.width,
+            settings.keyframes_only, settings.jpeg_quality, progress=progress, cancellable=True,
+        )
+
+
+@register_backend('image', image_formats, image_formats, cost=1, intermediate=False)
+async def convert_image(input_path: str, output_path: str, progress: ProgressCallback = None):
+    from src.tools.frames import convert_still, is_animated
+
+    executors = get_executors()
+    if input_path.lower().endswith('.gif') and output_path.lower().endswith('.png'):
+        # Анимированный GIF сохраняет анимацию как APNG
+        if await executors.run_in_thread(is_animated, input_path):
+            await convert_frames(input_path, output_path, progress)
+            return
+    report(progress, 0, 1)
+    with stage("encode"):
+        await executors.run_in_process(convert_still, input_path, output_path)
+    report(progress, 1, 1)
+
+
+@register_backend('document_copy', ['.doc'], ['.docx'], cost=0.1, cacheable=False)
+async def copy_document(input_path: str, output_path: str, progress: ProgressCallback = None):
+    with stage("write"):
+        await async_materialize_file(input_path, output_path, progress=progress)
+
+
+@register_backend('docx2pdf', ['.doc', '.docx'], ['.pdf'], cost=10)
+async def convert_docx_to_pdf(input_path: str, output_path: str, progress: ProgressCallback = None):
+    from docx2pdf import convert
+
+    report(progress, 0, 1)
+    with stage("encode"):
+        await get_executors().run_in_thread(convert, input_path, output_path)
+    report(progress, 1, 1)
+
+
+@register_backend('pdf2docx', ['.pdf'], ['.docx'], cost=20)
+async def convert_pdf_to_docx(input_path: str, output_path: str, progress: ProgressCallback = None):
+    """
+    Конвертирует PDF в DOCX, разбирая страницы частями по [pdf] chunk_pages.
+    Документы от parallel_min_pages страниц разбираются частями параллельно в пуле процессов,
+    более короткие - по одной части за раз. Прогресс сообщается по мере готовности частей.
+    """
+    import fitz
+
+    from src.config import config
+
+    executors = get_executors()
+    with stage("probe"), fitz.open(input_path) as doc:
+        page_count = doc.page_count
+    annotate(pages=page_count)
+
+    chunk_pages = max(config.pdf.chunk_pages, 1)
+    ranges = [(start, min(start + chunk_pages, page_count)) for start in range(0, page_count, chunk_pages)]
+    if page_count >= config.pdf.parallel_min_pages:
+        workers = config.pdf.docx_workers or executors.processes
+    else:
+        workers = 1
+    limit = asyncio.Semaphore(workers)
+
+    async def parse(start: int, end: int) -> tuple[int, dict]:
+        async with limit:
+            return end - start, await executors.run_in_process(_parse_pdf_pages, input_path, start, end)
+
+    parsed = []
+    done = 0
+    report(progress, done, page_count)
+    tasks = [asyncio.ensure_future(parse(start, end)) for start, end in ranges]
+    try:
+        with stage("decode"):
+            for chunk in asyncio.as_completed(tasks):
+                pages, data = await chunk
+                parsed.append(data)
+                done += pages
+                report(progress, done, page_count)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    with stage("write"):
+        await executors.run_in_process(_make_docx, input_path, parsed, output_path)
+
+
+def raster_settings() -> dict:
+    from src.config import config
+
+    return {'dpi': config.pdf.raster_dpi, 'jpeg_quality': config.pdf.raster_jpeg_quality}
+
+
+@register_backend('pdf_pages', ['.pdf'], ['.png', '.jpg', '.jpeg'] + page_archive_formats, cost=5,
+                  intermediate=False, cache_params=raster_settings)
+async def rasterize_pdf_pages(input_path: str, output_path: str, progress: ProgressCallback = None) -> str:
+    """
+    Сохраняет страницы PDF как изображения с разрешением [pdf] raster_dpi.
+    """
+    from src.config import config
+    from src.tools.rasterize import rasterize_pdf
+
+    return await rasterize_pdf(
+        input_path, output_path, dpi=config.pdf.raster_dpi, quality=config.pdf.raster_jpeg_quality,
+        chunk_pages=max(config.pdf.raster_chunk_pages, 1), progress=progress,
+    )
+
+
+def _parse_pdf_pages(pdf_path: str, start: int, end: int) -> dict:
+    """
+    Разбирает страницы [start, end) и возвращает их в сериализуемом виде pdf2docx.
+    """
+    from pdf2docx import Converter
+
+    cv = Converter(pdf_path)
+    try:
+        cv.parse(start=start, end=end, **cv.default_settings)
+        return cv.store()
+    finally:
+        cv.close()
+
+
+def _make_docx(pdf_path: str, parsed: list[dict], output_file: str):
+    from pdf2docx import Converter
+
+    cv = Converter(pdf_path)
+    try:
+        for data in parsed:
+            cv.restore(data)
+        cv.make_docx(output_file, **cv.default_settings)
+    finally:
+        cv.close()
@@ -0,0 +1,112 @@
+import os
+import re
+from typing import Optional
+
+from src.utils.executor import CancelToken
+from src.utils.progress import ProgressCallback, report
+
+# Кодеки субтитров, которые понимает каждый контейнер при копировании потоков
+SUBTITLE_CODECS = {'.mp4': 'mov_text', '.mov': 'mov_text', '.mkv': 'copy'}
+
+
+def ffmpeg_executable() -> str:
+    """
+    ffmpeg из imageio-ffmpeg, который поставляется вместе с приложением, иначе ffmpeg из PATH.
+    """
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return 'ffmpeg'
+
+
+def video_threads() -> int:
+    from src.config import config
+
+    return config.video.threads
+
+
+def run_ffmpeg(inputs: list[tuple[str, dict]], output_path: str, options: dict, total_frames: int = 0,
+               progress: ProgressCallback = None, cancel: CancelToken = None) -> str:
+    """
+    Запускает ffmpeg с входами inputs (путь, опции) и выходом output_path.
+    Кадры не проходят через Python: процесс читает и пишет файлы сам,
+    а из его вывода берётся только номер текущего кадра для progress.
+    При отмене процесс ffmpeg останавливается, а незаконченный результат удаляется.
+    """
+    from ffmpeg import FFmpeg, Progress
+
+    ffmpeg = FFmpeg(executable=ffmpeg_executable()).option('y')
+    for path, input_options in inputs:
+        ffmpeg = ffmpeg.input(path, input_options)
+    ffmpeg = ffmpeg.output(output_path, options)
+
+    @ffmpeg.on('progress')
+    def on_progress(status: Progress):
+        if cancel is not None and cancel.cancelled:
+            ffmpeg.terminate()
+            return
+        report(progress, min(status.frame, total_frames) if total_frames else status.frame, total_frames)
+
+    try:
+        ffmpeg.execute()
+        if cancel is not None:
+            cancel.check()
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    report(progress, total_frames, total_frames)
+    return output_path
+
+
+def measure_psnr(reference_path: str, distorted_path: str) -> float:
+    """
+    Средний PSNR видеопотока distorted_path относительно reference_path в дБ.
+    Используется, чтобы проверить, что разные режимы кодирования дают сопоставимое качество.
+    """
+    from ffmpeg import FFmpeg
+
+    ffmpeg = (
+        FFmpeg(executable=ffmpeg_executable())
+        .input(distorted_path)
+        .input(reference_path)
+        .output('-', {'lavfi': '[0:v:0][1:v:0]psnr', 'f': 'null'})
+    )
+    averages = []
+
+    @ffmpeg.on('stderr')
+    def on_stderr(line: str):
+        match = re.search(r'PSNR .*average:(\S+)', line)
+        if match:
+            averages.append(match.group(1))
+
+    ffmpeg.execute()
+    if not averages:
+        raise RuntimeError("ffmpeg не сообщил PSNR.")
+    return float(averages[-1])
+
+
+def optimize_video_options(output_path: str, crf: str, preset: str, threads: Optional[int] = None) -> dict:
+    """
+    Опции ffmpeg для сжатия видео libx264 с сохранением аудио и субтитров без перекодирования.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    options = {
+        'map': ['0:v:0', '0:a?'],
+        'codec:v': 'libx264',
+        'crf': crf,
+        'preset': preset,
+        'codec:a': 'copy',
+    }
+    if ext in SUBTITLE_CODECS:
+        options['map'].append('0:s?')
+        options['codec:s'] = SUBTITLE_CODECS[ext]
+    if ext in ('.mp4', '.mov'):
+        options['movflags'] = '+faststart'
+
+    threads = video_threads() if threads is None else threads
+    if threads:
+        options['threads'] = threads
+    return options
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+video_formats = ['.mp4', '.avi', '.mkv', '.mov']
+image_formats = ['.jpg', '.jpeg', '.png', '.gif']
+document_formats = ['.doc', '.docx', '.pdf']
+# Все страницы PDF одним файлом: многостраничный TIFF или ZIP с PNG
+page_archive_formats = ['.tiff', '.zip']
+# Порядок форматов в списках, которые видит пользователь
+all_formats = video_formats + image_formats + document_formats + page_archive_formats
+format_order = {ext: index for index, ext in enumerate(all_formats)}
+
+# Форматы, которые умеет сжимать FileOptimizer
+optimizable_formats = frozenset(video_formats + image_formats + ['.pdf'])
+
+media_types = {
+    **{ext: 'video' for ext in video_formats},
+    **{ext: 'image' for ext in image_formats},
+    **{ext: 'document' for ext in document_formats},
+}
+
+# Наибольшее число шагов в цепочке конвертации
+MAX_HOPS = 2
+
+# Функция шага конвертации: (исходный файл, результат, progress). Может вернуть путь, по которому
+# результат записан на самом деле (например, папку со страницами), None - результат в output_path
+ConvertFunc = Callable[[str, str, Optional[Callable[[int, int], None]]], Awaitable[Optional[str]]]
+
+
+def media_type(path: str):
+    """
+    Возвращает тип медиа ('video', 'image', 'document') по расширению файла или None.
+    """
+    return media_types.get(os.path.splitext(path)[1].lower())
+
+
+@dataclass(frozen=True)
+class Backend:
+    """
+    Способ конвертации: из любого формата inputs в любой формат outputs.
+    cost - относительная стоимость шага, по ней выбирается самый дешёвый путь.
+    cacheable=False - результат дешевле получить заново, чем хэшировать исходник (простое копирование).
+    intermediate=False - результат не используется как промежуточный: например, кадр из видео через
+    GIF получать дороже и хуже, чем отдельным способом.
+    cache_params - действующие настройки способа из конфигурации, они входят в ключ кэша результатов.
+    """
+    name: str
+    inputs: frozenset
+    outputs: frozenset
+    cost: float
+    convert: ConvertFunc
+    cacheable: bool = True
+    intermediate: bool = True
+    cache_params: Optional[Callable[[], dict]] = None
+
+
+@dataclass(frozen=True)
+class Step:
+    backend: Backend
+    source: str
+    target: str
+
+
+class ConversionGraph:
+    """
+    Граф конвертаций между форматами. Для каждой пары форматов заранее находится самая дешёвая
+    цепочка не длиннее max_hops шагов, поэтому выбор способа - поиск в словаре.
+    """
+
+    def __init__(self, backends: Iterable[Backend], max_hops: int = MAX_HOPS):
+        self.max_hops = max_hops
+        # Для каждой пары форматов остаётся самый дешёвый способ
+        self.edges: dict[str, dict[str, Backend]] = {}
+        for backend in backends:
+            for source in backend.inputs:
+                for target in backend.outputs:
+                    if source == target:
+                        continue
+                    current = self.edges.setdefault(source, {}).get(target)
+                    if current is None or backend.cost < current.cost:
+                        self.edges[source][target] = backend
+        self.plans: dict[str, dict[str, tuple[Step, ...]]] = {source: self._cheapest(source) for source in self.edges}
+
+    def _cheapest(self, source: str) -> dict[str, tuple[Step, ...]]:
+        """
+        Дейкстра от source с ограничением числа шагов: состояние - (формат, число шагов).
+        """
+        plans = {}
+        # Счётчик разрешает равенство стоимостей без сравнения цепочек
+        counter = itertools.count()
+        queue = [(0.0, 0, next(counter), source, ())]
+        visited = set()
+        while queue:
+            cost, hops, _, node, steps = heapq.heappop(queue)
+            if (node, hops) in visited:
+                continue
+            visited.add((node, hops))
+            if node != source and node not in plans:
+                plans[node] = steps
+            if hops == self.max_hops or (steps and not steps[-1].backend.intermediate):
+                continue
+            for target, backend in self.edges.get(node, {}).items():
+                if target != source and target not in plans:
+                    step = Step(backend, node, target)
+                    heapq.heappush(queue, (cost + backend.cost, hops + 1, next(counter), target, steps + (step,)))
+        return plans
+
+    def targets(self, source: str) -> list[str]:
+        return sorted(self.plans.get(source, {}), key=lambda ext: format_order.get(ext, len(format_order)))
+
+    def plan(self, source: str, target: str) -> Optional[tuple[Step, ...]]:
+        return self.plans.get(source, {}).get(target)
+
+
+_backends: list[Backend] = []
+_graph: Optional[ConversionGraph] = None
+
+
+def register_backend(name: str, inputs: Iterable[str], outputs: Iterable[str], cost: float, cacheable: bool = True,
+                     intermediate: bool = True, cache_params: Optional[Callable[[], dict]] = None):
+    """
+    Декоратор асинхронной функции convert(input_path, output_path, progress), добавляющий её в граф конвертаций.
+    """
+    def decorator(func: ConvertFunc) -> ConvertFunc:
+        global _graph
+        _backends.append(
+            Backend(name, frozenset(inputs), frozenset(outputs), cost, func, cacheable, intermediate, cache_params)
+        )
+        _graph = None
+        return func
+    return decorator
+
+
+def conversion_graph() -> ConversionGraph:
+    """
+    Граф по всем зарегистрированным способам. Строится один раз и заново после регистрации нового способа.
+    """
+    global _graph
+    if _graph is None:
+        _graph = ConversionGraph(_backends)
+    return _graph
@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+from src.tools.ffmpeg_pipeline import run_ffmpeg
+from src.utils.executor import CancelToken
+from src.utils.progress import ProgressCallback, report
+
+# Режимы PIL, которые каждый формат может записать без преобразования
+SAVE_MODES = {
+    'JPEG': ('RGB', 'L', 'CMYK'),
+    'PNG': ('RGB', 'RGBA', 'L', 'LA', 'P', 'I', '1'),
+    'GIF': ('P', 'L'),
+}
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF'}
+VIDEO_CODECS = {'.mp4': 'libx264', '.mkv': 'libx264', '.mov': 'libx264', '.avi': 'mpeg4'}
+
+
+def is_animated(path: str) -> bool:
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return getattr(img, 'is_animated', False)
+
+
+def convert_still(input_path: str, output_path: str, progress: ProgressCallback = None):
+    """
+    Конвертация одного кадра через PIL: декодированное изображение сразу передаётся кодеру,
+    без промежуточного массива NumPy. Для анимации берётся первый кадр.
+    """
+    from PIL import Image
+
+    image_format = FORMATS[os.path.splitext(output_path)[1].lower()]
+    report(progress, 0, 1)
+    with Image.open(input_path) as img:
+        frame = img
+        if frame.mode not in SAVE_MODES[image_format]:
+            if image_format == 'JPEG':
+                frame = frame.convert('RGB')
+            elif image_format == 'GIF':
+                frame = frame.convert('RGB').quantize()
+            else:
+                frame = frame.convert('RGBA')
+        frame.save(output_path, image_format)
+    report(progress, 1, 1)
+    return output_path
+
+
+def animation_to_video(input_path: str, output_path: str, total_frames: int = 0, progress: ProgressCallback = None,
+                       cancel: CancelToken = None) -> str:
+    """
+    GIF в видео через ffmpeg: кадры и их длительности читает ffmpeg, память не зависит от числа кадров.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    options = {
+        'codec:v': VIDEO_CODECS[ext],
+        'pix_fmt': 'yuv420p',
+        # yuv420p требует чётных размеров кадра
+        'vf': 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+        # Кадры сохраняют исходные временные метки, а значит и длительности
+        'fps_mode': 'passthrough',
+    }
+    if ext in ('.mp4', '.mov'):
+        options['movflags'] = '+faststart'
+    return run_ffmpeg([(input_path, {})], output_path, options, total_frames, progress, cancel)
+
+
+def animation_filters(max_width: int = 0, fps: float = 0) -> str:
+    """
+    Фильтры ffmpeg, которые уменьшают кадры до max_width и частоту до fps (0 - без изменений).
+    """
+    filters = []
+    if fps:
+        filters.append(f'fps={fps:g}')
+    if max_width:
+        # Меньшие кадры не увеличиваются, высота сохраняет пропорции
+        filters.append(f"scale='min(iw,{max_width})':-1:flags=lanczos")
+    return ','.join(filters)
+
+
+def video_to_animation(input_path: str, output_path: str, total_frames: int = 0, max_width: int = 0, fps: float = 0,
+                       progress: ProgressCallback = None, cancel: CancelToken = None) -> str:
+    """
+    Видео в анимированный GIF или APNG через ffmpeg, с уменьшением до max_width и fps (см. [animation]).
+    Для GIF палитра сначала строится отдельным проходом по всему видео (palettegen), а затем
+    применяется ко кадрам вторым проходом: в одном проходе ffmpeg держал бы в памяти все кадры.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    filters = animation_filters(max_width, fps)
+    if ext != '.gif':
+        options = {'map': '0:v:0', 'f': 'apng', 'plays': 0}
+        if filters:
+            options['vf'] = filters
+        return run_ffmpeg([(input_path, {})], output_path, options, total_frames, progress, cancel)
+
+    fd, palette = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(os.path.abspath(output_path)))
+    os.close(fd)
+    # Палитра строится по тем же уменьшенным кадрам, к которым потом применяется
+    source = f'[0:v:0]{filters}[scaled];[scaled]' if filters else '[0:v:0]'
+    try:
+        palettegen = f'{filters},palettegen=stats_mode=diff' if filters else 'palettegen=stats_mode=diff'
+        run_ffmpeg([(input_path, {})], palette, {'vf': palettegen}, cancel=cancel)
+        return run_ffmpeg(
+            [(input_path, {}), (palette, {})], output_path,
+            {'filter_complex': f'{source}[1:v]paletteuse=dither=bayer', 'loop': 0},
+            total_frames, progress, cancel,
+        )
+    finally:
+        if os.path.exists(palette):
+            os.remove(palette)
@@ -0,0 +1,127 @@
+import io
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from src.utils.materialize import materialize_file
+
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF'}
+
+
+@dataclass(frozen=True)
+class ImageOptimizeOptions:
+    quality: int = 95
+    # Наибольшая сторона результата в пикселях, None - без уменьшения
+    max_size: Optional[int] = None
+    strip_metadata: bool = False
+    # Желаемый размер файла в байтах: качество JPEG подбирается двоичным поиском
+    target_size: Optional[int] = None
+    min_quality: int = 40
+
+
+@dataclass(frozen=True)
+class ImageOptimizeResult:
+    input_path: str
+    output_path: str
+    input_size: int
+    output_size: int
+    kept_original: bool
+    quality: Optional[int] = None
+
+
+def _encode(img, image_format: str, quality: int, save_kwargs: dict) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        img.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True, **save_kwargs)
+    else:
+        img.save(buffer, image_format, optimize=True, **save_kwargs)
+    return buffer.getvalue()
+
+
+def _encode_to_target(img, save_kwargs: dict, options: ImageOptimizeOptions) -> tuple[bytes, int]:
+    """
+    Наибольшее качество JPEG, при котором файл не больше target_size.
+    Если даже min_quality не укладывается, возвращается результат с min_quality.
+    """
+    low, high = options.min_quality, options.quality
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(img, 'JPEG', quality, save_kwargs)
+        if len(data) <= options.target_size:
+            best = (data, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        best = (_encode(img, 'JPEG', options.min_quality, save_kwargs), options.min_quality)
+    return best
+
+
+def optimize_image_file(input_path: str, output_path: str,
+                        options: ImageOptimizeOptions = ImageOptimizeOptions()) -> ImageOptimizeResult:
+    """
+    Сжимает одно изображение с учётом формата.
+    JPEG при уменьшении декодируется сразу в уменьшенном масштабе (Image.draft),
+    а если результат без уменьшения не меньше исходника, в output_path копируется исходный файл.
+    """
+    from PIL import Image, ImageSequence
+
+    ext = os.path.splitext(input_path)[1].lower()
+    image_format = FORMATS.get(ext)
+    if image_format is None:
+        raise ValueError("Неподдерживаемый формат изображения.")
+    input_size = os.path.getsize(input_path)
+
+    with Image.open(input_path) as img:
+        animated = getattr(img, 'is_animated', False)
+        resized = bool(options.max_size) and max(img.size) > options.max_size
+        # Анимированный PNG сохраняется одним кадром, поэтому кадры по отдельности уменьшаются только у GIF
+        resized = resized and (not animated or image_format == 'GIF')
+        frames, durations = None, []
+        if resized and animated:
+            frames = []
+            for frame in ImageSequence.Iterator(img):
+                durations.append(frame.info.get('duration', 0))
+                frame = frame.convert('RGBA')
+                frame.thumbnail((options.max_size, options.max_size), Image.Resampling.LANCZOS)
+                frames.append(frame)
+        elif resized:
+            if image_format == 'JPEG':
+                # Декодер JPEG сам уменьшает кадр в 2, 4 или 8 раз, не распаковывая полный размер
+                img.draft('RGB', (options.max_size, options.max_size))
+            img.thumbnail((options.max_size, options.max_size), Image.Resampling.LANCZOS)
+
+        save_kwargs = {}
+        if not options.strip_metadata:
+            for key in ('exif', 'icc_profile'):
+                if img.info.get(key):
+                    save_kwargs[key] = img.info[key]
+        if animated and image_format == 'GIF':
+            # Все кадры, их длительности и число повторов сохраняются
+            save_kwargs.update(save_all=True, loop=img.info.get('loop', 0))
+            if frames is not None:
+                img = frames[0]
+                save_kwargs.update(append_images=frames[1:], duration=durations, disposal=2)
+            elif 'duration' in img.info:
+                save_kwargs['duration'] = img.info['duration']
+
+        quality = None
+        if image_format == 'JPEG':
+            if img.mode not in ('RGB', 'L', 'CMYK'):
+                img = img.convert('RGB')
+            if options.target_size:
+                data, quality = _encode_to_target(img, save_kwargs, options)
+            else:
+                quality = options.quality
+                data = _encode(img, image_format, quality, save_kwargs)
+        else:
+            data = _encode(img, image_format, options.quality, save_kwargs)
+
+    if len(data) >= input_size and not resized:
+        materialize_file(input_path, output_path)
+        return ImageOptimizeResult(input_path, output_path, input_size, input_size, True)
+
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return ImageOptimizeResult(input_path, output_path, input_size, len(data), False, quality)
@@ -0,0 +1,153 @@
+import os
+from typing import Optional, Sequence
+
+from src.utils.executor import CancelToken
+from src.utils.progress import ProgressCallback, report
+
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+
+
+def spread_timestamps(duration: float, count: int) -> list[float]:
+    """
+    count моментов равномерно по видео: середины равных отрезков, поэтому первый и последний кадр
+    не попадают на заставку и титры.
+    """
+    if duration <= 0:
+        return [0.0]
+    return [duration * (index + 0.5) / count for index in range(count)]
+
+
+def scaled_size(width: int, height: int, target_width: int) -> tuple[int, int]:
+    """
+    Размер кадра шириной не больше target_width с сохранением пропорций, стороны чётные.
+    """
+    if not target_width or width <= target_width:
+        return width, height
+    return target_width - target_width % 2, max(round(height * target_width / width / 2) * 2, 2)
+
+
+def extract_frames(video_path: str, timestamps: Optional[Sequence[float]] = None, count: int = 1, width: int = 320,
+                   keyframes_only: bool = True, progress: ProgressCallback = None, cancel: CancelToken = None) -> list:
+    """
+    Декодирует только нужные кадры: для каждого момента - переход к ближайшему предыдущему
+    ключевому кадру и декодирование от него.
+    keyframes_only=True - берётся сам ключевой кадр, а остальные кадры декодер пропускает (skip_frame NONKEY),
+    поэтому время не зависит от длины видео. keyframes_only=False - декодирование до точного момента.
+    Кадры уменьшаются до width при преобразовании в RGB и возвращаются массивами NumPy (высота, ширина, 3).
+    timestamps=None - count моментов равномерно по всему видео.
+    """
+    import av
+
+    with av.open(video_path) as container:
+        if not container.streams.video:
+            raise ValueError(f"В файле {video_path} нет видеопотока.")
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        if keyframes_only:
+            stream.codec_context.skip_frame = 'NONKEY'
+
+        if timestamps is None:
+            duration = container.duration / av.time_base if container.duration else 0.0
+            if not duration and stream.duration and stream.time_base:
+                duration = float(stream.duration * stream.time_base)
+            timestamps = spread_timestamps(duration, count)
+
+        size = scaled_size(stream.codec_context.width, stream.codec_context.height, width)
+        start = float(stream.start_time * stream.time_base) if stream.start_time and stream.time_base else 0.0
+        frames = []
+        report(progress, 0, len(timestamps))
+        for timestamp in timestamps:
+            if cancel is not None:
+                cancel.check()
+            frame = seek_frame(container, stream, start + timestamp, keyframes_only)
+            if frame is None:
+                # За последним ключевым кадром ничего нет - повторяется предыдущий кадр
+                if not frames:
+                    continue
+                frames.append(frames[-1])
+            else:
+                frames.append(frame.reformat(size[0], size[1], 'rgb24', interpolation='AREA').to_ndarray())
+            report(progress, len(frames), len(timestamps))
+    return frames
+
+
+def seek_frame(container, stream, timestamp: float, keyframes_only: bool):
+    """
+    Первый кадр с ключевого кадра перед timestamp (keyframes_only) или первый кадр не раньше timestamp.
+    """
+    offset = int(timestamp / stream.time_base) if stream.time_base else 0
+    container.seek(offset, stream=stream, backward=True, any_frame=False)
+    last = None
+    for frame in container.decode(stream):
+        if keyframes_only or frame.time is None or frame.time >= timestamp:
+            return frame
+        last = frame
+    return last
+
+
+def contact_sheet(frames: list, columns: int = 4, padding: int = 4, background: int = 16):
+    """
+    Склеивает кадры одного размера в сетку одной операцией над массивом: (n, h, w, 3) ->
+    (строки, колонки, h, w, 3) -> (строки * h, колонки * w, 3). Пустые ячейки последней строки заливаются фоном.
+    """
+    import numpy as np
+
+    if not frames:
+        raise ValueError("Нет кадров для листа.")
+    columns = max(min(columns, len(frames)), 1)
+    rows = -(-len(frames) // columns)
+    stack = np.stack(frames)
+    empty = rows * columns - len(frames)
+    # Отступ вокруг каждого кадра и недостающие ячейки добавляются одним np.pad
+    stack = np.pad(
+        stack, ((0, empty), (padding, padding), (padding, padding), (0, 0)), constant_values=background,
+    )
+    _, height, width, channels = stack.shape
+    grid = stack.reshape(rows, columns, height, width, channels).transpose(0, 2, 1, 3, 4)
+    return np.ascontiguousarray(grid.reshape(rows * height, columns * width, channels))
+
+
+def save_frame(array, output_path: str, quality: int = 85) -> str:
+    from PIL import Image
+
+    image_format = FORMATS[os.path.splitext(output_path)[1].lower()]
+    options = {'quality': quality, 'optimize': True} if image_format == 'JPEG' else {'compress_level': 6}
+    Image.fromarray(array).save(output_path, image_format, **options)
+    return output_path
+
+
+def thumbnail_frame(video_path: str, width: int = 320, timestamp: Optional[float] = None):
+    """
+    Кадр для миниатюры: ключевой кадр у timestamp или, если он не указан, из середины видео,
+    где реже бывают заставка и чёрный экран. None, если кадр не декодировался.
+    """
+    timestamps = None if timestamp is None else [timestamp]
+    frames = extract_frames(video_path, timestamps, count=1, width=width)
+    return frames[0] if frames else None
+
+
+def make_contact_sheet(video_path: str, output_path: str, count: int = 16, columns: int = 4, width: int = 320,
+                       keyframes_only: bool = True, quality: int = 85, progress: ProgressCallback = None,
+                       cancel: CancelToken = None) -> str:
+    """
+    Лист из count кадров, равномерно распределённых по видео, в columns колонок.
+    """
+    frames = extract_frames(video_path, count=count, width=width, keyframes_only=keyframes_only,
+                            progress=progress, cancel=cancel)
+    return save_frame(contact_sheet(frames, columns), output_path, quality)
+
+
+def save_frames(video_path: str, output_dir: str, count: int = 16, width: int = 320, keyframes_only: bool = True,
+                quality: int = 85, image_format: str = '.jpg', progress: ProgressCallback = None,
+                cancel: CancelToken = None) -> list[str]:
+    """
+    Сохраняет count кадров, равномерно распределённых по видео, отдельными файлами в output_dir.
+    """
+    frames = extract_frames(video_path, count=count, width=width, keyframes_only=keyframes_only,
+                            progress=progress, cancel=cancel)
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return [
+        save_frame(frame, os.path.join(output_dir, f"{stem}-{index + 1:04d}{image_format}"), quality)
+        for index, frame in enumerate(frames)
+    ]
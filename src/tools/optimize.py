@@ -1,101 +1,150 @@
 import os
-from PIL import Image
-import imageio
-import fitz
+
+from src.logs.metrics import annotate, stage, track_job
+from src.tools.cache import run_cached
+from src.tools.formats import media_types, optimizable_formats
+from src.utils.executor import CancelToken, get_executors
+from src.utils.materialize import async_materialize_file
+from src.utils.progress import ProgressCallback, report
 
 
 class FileOptimizer:
-    video_formats = ['.mp4', '.avi', '.mkv', '.mov']
-    image_formats = ['.jpg', '.jpeg', '.png', '.gif']
-    document_formats = ['.doc', '.docx', '.pdf']
+    """
+    Сжатие файлов. PIL, imageio и PyMuPDF импортируются при первой оптимизации соответствующего типа.
+    """
+    image_options = ('quality', 'max_size', 'strip_metadata', 'target_size')
 
     @staticmethod
     def is_format_supported(file_format: str):
-        file_format = file_format.lower()
-        if file_format in FileOptimizer.image_formats:
-            return True
-        if file_format in FileOptimizer.video_formats:
-            return True
-        if file_format == '.pdf':
-            return True
-        return False
+        return file_format.lower() in optimizable_formats
 
     @staticmethod
     def determine_video_parameters(input_path):
         """
-        Определяет параметры для оптимизации видео на основе разрешения.
+        Определяет параметры для оптимизации видео по метаданным файла.
+        Возвращает None, если перекодирование не уменьшит файл.
         """
-        reader = imageio.get_reader(input_path)
-        meta = reader.get_meta_data()
-        resolution = meta.get('size', (640, 480))
-        width, height = resolution
-        reader.close()
-
-        if width >= 1920 or height >= 1080:
-            crf = '28'
-            preset = 'slow'
-        elif width >= 1280 or height >= 720:
-            crf = '23'
-            preset = 'medium'
-        else:
-            crf = '18'
-            preset = 'fast'
-        return crf, preset
+        from src.tools.probe import probe_media
+        from src.tools.video_policy import choose_video_settings
+
+        return choose_video_settings(probe_media(input_path))
 
     @staticmethod
-    async def optimize_image(input_path, output_path):
+    async def optimize_image(input_path, output_path, progress: ProgressCallback = None, **options):
         """
-        Оптимизация изображений
+        Оптимизация изображений.
+        options - поля ImageOptimizeOptions: quality, max_size, strip_metadata, target_size.
+        Перекодирование занимает CPU, поэтому выполняется в пуле процессов.
         """
-        ext = os.path.splitext(input_path)[1].lower()
-        with Image.open(input_path) as img:
-            if ext in ['.jpg', '.jpeg']:
-                img.save(output_path, 'JPEG', optimize=True, quality=95)
-            elif ext == '.png':
-                img.save(output_path, 'PNG', optimize=True)
-            elif ext == '.gif':
-                img.save(output_path, 'GIF', optimize=True)
-            else:
-                raise ValueError("Неподдерживаемый формат изображения.")
-        return output_path
+        from src.tools.image_optimizer import ImageOptimizeOptions, optimize_image_file
+
+        report(progress, 0, 1)
+        # Декодирование и кодирование выполняются в одном вызове в процессе пула
+        with stage("encode"):
+            result = await get_executors().run_in_process(
+                optimize_image_file, input_path, output_path, ImageOptimizeOptions(**options)
+            )
+        report(progress, 1, 1)
+        return result.output_path
 
     @classmethod
-    async def optimize_video(cls, input_path, output_path, crf=None, preset=None):
+    async def optimize_video(cls, input_path, output_path, crf=None, preset=None, progress: ProgressCallback = None):
         """
         Оптимизация видео.
-        Если параметры crf или preset не заданы, они определяются автоматически.
+        Если параметры crf или preset не заданы, они определяются автоматически по метаданным,
+        а файл, который перекодирование не уменьшит, копируется как есть.
+        Кодирование целиком выполняет процесс ffmpeg: кадры не декодируются в Python,
+        аудио и субтитры копируются без изменений. Задача может быть отменена.
+        progress получает число закодированных кадров.
+        """
+        from src.tools.probe import probe_media
+
+        executors = get_executors()
+        auto = crf is None or preset is None
+        with stage("probe"):
+            info = await executors.run_in_thread(probe_media, input_path)
+            settings = await executors.run_in_thread(cls.determine_video_parameters, input_path) if auto else None
+        if auto:
+            if settings is None:
+                # Файл уже сжат не хуже, чем получится при перекодировании, или это HDR
+                annotate(reencoded=False)
+                with stage("write"):
+                    await async_materialize_file(input_path, output_path, progress=progress)
+                return output_path
+            crf, preset = settings.crf, settings.preset
+
+        total_frames = info.video.frames if info.video else 0
+        segments = cls.video_segments(info)
+        annotate(frames=total_frames, segments=segments, crf=crf, preset=preset)
+        if segments > 1:
+            from src.tools.segmented import encode_segmented
+
+            result = await encode_segmented(input_path, output_path, info, crf, preset, segments, progress)
+            if result is not None:
+                return result
+            # Сегменты потеряли или добавили кадры - видео кодируется целиком
+            annotate(segments=1)
+
+        # ffmpeg декодирует, кодирует и пишет файл в одном процессе, поэтому это один этап
+        with stage("encode"):
+            return await executors.run_in_thread(
+                cls._optimize_video, input_path, output_path, crf, preset, total_frames,
+                progress=progress, cancellable=True,
+            )
+
+    @staticmethod
+    def video_segments(info) -> int:
+        """
+        На сколько сегментов делить видео для параллельного кодирования (1 - кодировать целиком).
         """
-        if crf is None or preset is None:
-            crf, preset = cls.determine_video_parameters(input_path)
+        from src.config import config
+        from src.tools.segmented import plan_segments
 
-        reader = imageio.get_reader(input_path)
-        meta = reader.get_meta_data()
-        fps = meta.get('fps', 25)
+        if not config.video.segmented or info.video is None or info.duration < config.video.segment_min_duration:
+            return 1
+        return plan_segments(info.duration, config.video.segment_min_seconds)
+
+    @staticmethod
+    def _optimize_video(input_path, output_path, crf, preset, total_frames, progress: ProgressCallback = None,
+                        cancel: CancelToken = None):
+        from src.tools.ffmpeg_pipeline import optimize_video_options, run_ffmpeg
 
-        writer = imageio.get_writer(
-            output_path, fps=fps, codec='libx264',
-            ffmpeg_params=['-crf', crf, '-preset', preset]
+        return run_ffmpeg(
+            [(input_path, {})], output_path, optimize_video_options(output_path, crf, preset),
+            total_frames, progress, cancel,
         )
 
-        for frame in reader:
-            writer.append_data(frame)
+    @staticmethod
+    def pdf_options():
+        from src.config import config
+        from src.tools.pdf_optimizer import PdfOptimizeOptions
 
-        writer.close()
-        reader.close()
-        return output_path
+        return PdfOptimizeOptions(
+            max_dpi=config.pdf.max_dpi,
+            jpeg_quality=config.pdf.jpeg_quality,
+            subset_fonts=config.pdf.subset_fonts,
+            mode=config.pdf.save_mode,
+        )
 
     @staticmethod
-    async def optimize_pdf(input_path, output_path):
+    async def optimize_pdf(input_path, output_path, progress: ProgressCallback = None):
         """
         Оптимизация PDF.
+        Изображения с избыточным разрешением уменьшаются и перекодируются в пуле процессов,
+        шрифты урезаются до используемых символов. Настройки берутся из секции [pdf].
+        progress получает число обработанных изображений.
         """
-        doc = fitz.open(input_path)
-        doc.save(output_path, garbage=4, deflate=True)
-        doc.close()
+        import structlog
+
+        from src.tools.pdf_optimizer import optimize_pdf_file
+
+        result = await optimize_pdf_file(input_path, output_path, FileOptimizer.pdf_options(), progress)
+        annotate(images=result.images_recompressed)
+        structlog.get_logger().info("PDF optimized", input=input_path, **result.as_dict())
         return output_path
 
     @classmethod
-    async def optimize_file(cls, input_path, output_path=None, **kwargs):
+    async def optimize_file(cls, input_path, output_path=None, progress: ProgressCallback = None, **kwargs):
         """
         Универсальная функция оптимизации файла.
         Определяет тип файла по расширению и вызывает соответствующий метод.
@@ -105,14 +154,56 @@ class FileOptimizer:
             base, ext_part = os.path.splitext(input_path)
             output_path = base + '_optimized' + ext_part
 
-        if ext in cls.image_formats:
-            return await cls.optimize_image(input_path, output_path)
-        elif ext in cls.video_formats:
-            return await cls.optimize_video(input_path, output_path, crf=kwargs.get('crf'), preset=kwargs.get('preset'))
-        elif ext in cls.document_formats:
-            if ext == '.pdf':
-                return await cls.optimize_pdf(input_path, output_path)
-            else:
-                raise NotImplementedError(f"Оптимизация для файлов формата {ext} не реализована.")
+        with track_job('optimize', input_path, **kwargs) as job:
+            job.output_path = output_path
+            if not cls.is_format_supported(ext):
+                return await cls._optimize(ext, input_path, output_path, progress, **kwargs)
+
+            return await run_cached(
+                'optimize', input_path, output_path, cls.cache_params(ext, **kwargs),
+                lambda: cls._optimize(ext, input_path, output_path, progress, **kwargs), progress,
+            )
+
+    @classmethod
+    def cache_params(cls, ext, **kwargs) -> dict:
+        """
+        Параметры, от которых зависит результат: переданные явно и действующие значения из конфигурации,
+        чтобы после изменения настроек кэш не возвращал результат, полученный со старыми.
+        """
+        from dataclasses import asdict
+
+        kind = media_types.get(ext)
+        params = dict(kwargs)
+        if kind == 'image':
+            from src.tools.image_optimizer import ImageOptimizeOptions
+
+            image_options = {key: kwargs[key] for key in cls.image_options if kwargs.get(key) is not None}
+            params['image'] = asdict(ImageOptimizeOptions(**image_options))
+        elif kind == 'video':
+            from src.config import config
+
+            params['video'] = {
+                'segmented': config.video.segmented,
+                'segment_min_duration': config.video.segment_min_duration,
+                'segment_min_seconds': config.video.segment_min_seconds,
+            }
+        elif ext == '.pdf':
+            params['pdf'] = asdict(cls.pdf_options())
+        return params
+
+    @classmethod
+    async def _optimize(cls, ext, input_path, output_path, progress: ProgressCallback = None, **kwargs):
+        kind = media_types.get(ext)
+        if kind == 'image':
+            image_options = {key: kwargs[key] for key in cls.image_options if kwargs.get(key) is not None}
+            return await cls.optimize_image(input_path, output_path, progress, **image_options)
+        elif kind == 'video':
+            return await cls.optimize_video(
+                input_path, output_path, crf=kwargs.get('crf'), preset=kwargs.get('preset'), progress=progress
+            )
+        elif ext == '.pdf':
+            return await cls.optimize_pdf(input_path, output_path, progress)
+        elif kind == 'document':
+            raise NotImplementedError(f"Оптимизация для файлов формата {ext} не реализована.")
         else:
             raise ValueError("Формат файла не поддерживается для оптимизации.")
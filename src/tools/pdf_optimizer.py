@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import math
+import os
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from src.logs.metrics import stage
+from src.utils.executor import get_executors
+from src.utils.materialize import materialize_file
+from src.utils.progress import ProgressCallback, report
+
+# Фильтры двухцветных сканов: JPEG для них только увеличивает размер
+BILEVEL_FILTERS = ('CCITTFaxDecode', 'JBIG2Decode')
+FONT_FILE_KEYS = ('FontFile', 'FontFile2', 'FontFile3')
+
+
+@dataclass(frozen=True)
+class PdfOptimizeOptions:
+    # Изображения с большим разрешением на странице уменьшаются до max_dpi
+    max_dpi: int = 150
+    jpeg_quality: int = 75
+    subset_fonts: bool = True
+    # 'rewrite' - полная пересборка ради размера, 'incremental' - быстрое дописывание изменений в копию
+    mode: str = 'rewrite'
+    # Изображения меньше этого размера в байтах не перекодируются
+    min_image_bytes: int = 16 * 1024
+
+
+@dataclass(frozen=True)
+class ImageCandidate:
+    # Все XObject с одинаковым содержимым: (xref, страница). Новые данные записываются в каждый,
+    # после чего полная пересборка объединяет их снова
+    targets: tuple[tuple[int, int], ...]
+    scale: float
+    raw_size: int
+
+    @property
+    def xref(self) -> int:
+        return self.targets[0][0]
+
+
+@dataclass
+class PdfOptimizeReport:
+    input_size: int = 0
+    output_size: int = 0
+    images_recompressed: int = 0
+    images_saved: int = 0
+    duplicate_images: int = 0
+    duplicates_saved: int = 0
+    fonts_saved: int = 0
+    structure_saved: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _font_bytes(doc) -> int:
+    total = 0
+    for xref in range(1, doc.xref_length()):
+        for key in FONT_FILE_KEYS:
+            kind, value = doc.xref_get_key(xref, key)
+            if kind == 'xref':
+                total += len(doc.xref_stream_raw(int(value.split()[0])) or b'')
+    return total
+
+
+def collect_images(pdf_path: str, options: PdfOptimizeOptions) -> tuple[list[ImageCandidate], dict[bytes, list]]:
+    """
+    Находит изображения, размещённые с разрешением выше max_dpi, и группирует одинаковые по содержимому XObject.
+    Возвращает кандидатов на перекодирование и группы дубликатов: хэш -> [(xref, страница, размер)].
+    """
+    import fitz
+
+    placements = {}
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for info in page.get_image_info(xrefs=True):
+                xref = info.get('xref')
+                if not xref:
+                    continue
+                width_pt = info['bbox'][2] - info['bbox'][0]
+                # Наибольший размер на странице определяет наименьшее нужное разрешение
+                if width_pt > placements.get(xref, (None, 0))[1]:
+                    placements[xref] = (page.number, width_pt, info['width'])
+
+        groups: dict[bytes, list] = {}
+        widths: dict[bytes, tuple[float, int]] = {}
+        for xref, (page_number, width_pt, width_px) in sorted(placements.items()):
+            raw = doc.xref_stream_raw(xref) or b''
+            digest = hashlib.blake2b(raw, digest_size=16).digest()
+            groups.setdefault(digest, []).append((xref, page_number, len(raw)))
+            if width_pt > widths.get(digest, (0, 0))[0]:
+                widths[digest] = (width_pt, width_px)
+
+        candidates = []
+        for digest, group in groups.items():
+            xref, _, raw_size = group[0]
+            if raw_size < options.min_image_bytes:
+                continue
+            if doc.xref_get_key(xref, 'SMask')[0] != 'null' or doc.xref_get_key(xref, 'ImageMask')[1] == 'true':
+                continue
+            if any(name in doc.xref_get_key(xref, 'Filter')[1] for name in BILEVEL_FILTERS):
+                continue
+
+            width_pt, width_px = widths[digest]
+            dpi = width_px / (width_pt / 72) if width_pt > 0 else 0
+            # Изображения с разрешением не выше max_dpi не трогаются: JPEG испортил бы графику и сканы текста
+            if dpi <= options.max_dpi:
+                continue
+            targets = tuple((xref, page_number) for xref, page_number, _ in group)
+            candidates.append(ImageCandidate(targets, options.max_dpi / dpi, raw_size))
+    return candidates, {digest: group for digest, group in groups.items() if len(group) > 1}
+
+
+def recompress_images(pdf_path: str, candidates: list[ImageCandidate], quality: int) -> list[Optional[bytes]]:
+    """
+    Перекодирует изображения в JPEG с уменьшением до candidate.scale.
+    Документ открывается один раз на часть кандидатов, между процессами передаются только результаты.
+    Для изображения, новый поток которого не меньше исходного, возвращается None.
+    """
+    import io
+
+    import fitz
+    from PIL import Image
+
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for candidate in candidates:
+            pix = fitz.Pixmap(doc, candidate.xref)
+            if pix.colorspace is None or pix.colorspace.n not in (1, 3) or pix.alpha:
+                pix = fitz.Pixmap(fitz.csRGB, pix, 0)
+            mode = 'L' if pix.n == 1 else 'RGB'
+            img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+            size = (max(int(pix.width * candidate.scale), 1), max(int(pix.height * candidate.scale), 1))
+            img = img.resize(size, Image.Resampling.LANCZOS)
+
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=quality, optimize=True)
+            data = buffer.getvalue()
+            results.append(data if len(data) < candidate.raw_size else None)
+    return results
+
+
+def apply_changes(pdf_path: str, output_path: str, replacements: dict[int, tuple[int, bytes]],
+                  options: PdfOptimizeOptions) -> int:
+    """
+    Записывает перекодированные изображения и сохраняет документ.
+    Возвращает, сколько байт сэкономило подмножество шрифтов.
+    """
+    import fitz
+
+    if options.mode == 'incremental':
+        materialize_file(pdf_path, output_path)
+        doc = fitz.open(output_path)
+    else:
+        doc = fitz.open(pdf_path)
+
+    try:
+        for xref, (page_number, data) in replacements.items():
+            doc[page_number].replace_image(xref, stream=data)
+
+        fonts_saved = 0
+        if options.subset_fonts:
+            before = _font_bytes(doc)
+            try:
+                doc.subset_fonts()
+            except ImportError:
+                # Для подмножества шрифтов PyMuPDF нужен fontTools, без него шрифты остаются как есть
+                pass
+            fonts_saved = before - _font_bytes(doc)
+
+        if options.mode == 'incremental':
+            doc.saveIncr()
+        else:
+            doc.save(output_path, garbage=4, deflate=True, clean=True)
+    finally:
+        doc.close()
+    return fonts_saved
+
+
+async def optimize_pdf_file(input_path: str, output_path: str, options: PdfOptimizeOptions = PdfOptimizeOptions(),
+                            progress: ProgressCallback = None) -> PdfOptimizeReport:
+    """
+    Сжимает PDF: изображения с разрешением выше max_dpi уменьшаются и перекодируются параллельно
+    в пуле процессов, одинаковые XObject объединяются, шрифты урезаются до используемых символов.
+    Возвращает отчёт о сэкономленных байтах по категориям. progress считается в изображениях.
+    """
+    if options.mode not in ('rewrite', 'incremental'):
+        raise ValueError(f"Неизвестный режим сохранения PDF {options.mode}.")
+
+    executors = get_executors()
+    with stage("probe"):
+        candidates, duplicate_groups = await executors.run_in_process(collect_images, input_path, options)
+
+    # Несколько частей на процесс выравнивают нагрузку, документ открывается один раз на часть
+    batch = max(math.ceil(len(candidates) / (executors.processes * 2)), 1)
+    batches = [candidates[index:index + batch] for index in range(0, len(candidates), batch)]
+    limit = asyncio.Semaphore(executors.processes)
+    done = 0
+
+    async def recompress(part: list[ImageCandidate]) -> list[tuple[ImageCandidate, Optional[bytes]]]:
+        nonlocal done
+        async with limit:
+            data = await executors.run_in_process(recompress_images, input_path, part, options.jpeg_quality)
+        done += len(part)
+        report(progress, done, len(candidates))
+        return list(zip(part, data))
+
+    report(progress, 0, len(candidates))
+    with stage("encode"):
+        results = [item for part in await asyncio.gather(*(recompress(part) for part in batches)) for item in part]
+    recompressed = {candidate.xref: data for candidate, data in results if data is not None}
+    replacements = {
+        xref: (page_number, data)
+        for candidate, data in results if data is not None
+        for xref, page_number in candidate.targets
+    }
+
+    with stage("write"):
+        fonts_saved = await executors.run_in_process(apply_changes, input_path, output_path, replacements, options)
+
+    # Дубликаты удаляются только при полной пересборке (garbage=4); у перекодированной группы
+    # сохраняется одна копия нового потока, а не исходного
+    duplicates_saved = 0
+    if options.mode == 'rewrite':
+        for group in duplicate_groups.values():
+            xref, _, raw_size = group[0]
+            size = len(recompressed[xref]) if xref in recompressed else raw_size
+            duplicates_saved += size * (len(group) - 1)
+
+    result = PdfOptimizeReport(
+        input_size=os.path.getsize(input_path),
+        output_size=os.path.getsize(output_path),
+        images_recompressed=len(recompressed),
+        images_saved=sum(candidate.raw_size - len(data) for candidate, data in results if data is not None),
+        duplicate_images=sum(len(group) - 1 for group in duplicate_groups.values()),
+        duplicates_saved=duplicates_saved,
+        fonts_saved=fonts_saved,
+    )
+    result.structure_saved = (
+        result.input_size - result.output_size - result.images_saved - result.duplicates_saved - result.fonts_saved
+    )
+    return result
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from src.tools.cache import default_cache_dir
+from src.tools.formats import media_type
+from src.utils.executor import get_executors
+
+PREVIEW_VERSION = 2
+# Запись на диск проверяет размер папки не при каждом сохранении: обход папки дороже самой миниатюры
+EVICT_EVERY = 64
+
+
+def render_preview(path: str, size: int, quality: int = 80) -> Optional[bytes]:
+    """
+    Миниатюра файла в JPEG не больше size x size или None, если формат не поддерживается.
+    Декодируется только то, что нужно для миниатюры: ключевой кадр из середины видео, первая страница PDF,
+    JPEG - сразу в уменьшенном виде (draft PIL).
+    """
+    from PIL import Image
+
+    kind = media_type(path)
+    ext = os.path.splitext(path)[1].lower()
+    if kind == 'video':
+        from src.tools.keyframes import thumbnail_frame
+
+        frame = thumbnail_frame(path, width=size)
+        if frame is None:
+            return None
+        image = Image.fromarray(frame)
+    elif ext == '.pdf':
+        import fitz
+
+        with fitz.open(path) as doc:
+            if not doc.page_count:
+                return None
+            page = doc[0]
+            zoom = size / max(page.rect.width, page.rect.height)
+            return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).tobytes('jpg', jpg_quality=quality)
+    elif kind == 'image':
+        image = Image.open(path)
+        # Декодер JPEG сразу уменьшает изображение в 2-8 раз, остальные форматы draft игнорируют
+        image.draft('RGB', (size, size))
+    else:
+        return None
+
+    with image:
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        if image.mode == 'RGBA':
+            # Прозрачные области на тёмном фоне окна
+            background = Image.new('RGB', image.size, (43, 43, 60))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        return buffer.getvalue()
+
+
+class PreviewCache:
+    """
+    Миниатюры файлов: LRU в памяти на memory_items записей поверх кэша на диске.
+    Ключ - путь, время изменения и размер файла, поэтому изменённый файл получает новую миниатюру.
+    Чтение с диска и построение выполняются в пуле потоков, одновременные запросы одного файла
+    ждут одно построение.
+    """
+
+    def __init__(self, directory: Optional[str], size: int = 256, memory_items: int = 128, max_disk_size: int = 0):
+        self.directory = directory
+        self.size = size
+        self.memory_items = memory_items
+        self.max_disk_size = max_disk_size
+        self.memory: OrderedDict[str, Optional[bytes]] = OrderedDict()
+        self.pending: dict[str, asyncio.Task] = {}
+        self._stores = 0
+
+    def key(self, path: str) -> str:
+        stat = os.stat(path)
+        payload = f"{PREVIEW_VERSION}\0{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}\0{self.size}"
+        return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.jpg')
+
+    def remember(self, key: str, data: Optional[bytes]):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    async def get(self, path: str) -> Optional[bytes]:
+        """
+        JPEG миниатюры или None, если для формата миниатюры нет или файл не удалось прочитать.
+        """
+        try:
+            key = self.key(path)
+        except OSError:
+            return None
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if key not in self.pending:
+            self.pending[key] = asyncio.ensure_future(self._build(key, path))
+        # Отмена ожидания (например, выбран другой файл) не прерывает построение: миниатюра попадёт в кэш
+        return await asyncio.shield(self.pending[key])
+
+    async def _build(self, key: str, path: str) -> Optional[bytes]:
+        try:
+            data = await get_executors().run_in_thread(self.load, key, path)
+        except Exception:
+            # Повреждённый или недочитанный файл - просто без миниатюры
+            data = None
+        finally:
+            del self.pending[key]
+        self.remember(key, data)
+        return data
+
+    def load(self, key: str, path: str) -> Optional[bytes]:
+        if self.directory:
+            entry = self.entry_path(key)
+            try:
+                with open(entry, 'rb') as f:
+                    data = f.read()
+                os.utime(entry)
+                return data
+            except FileNotFoundError:
+                pass
+
+        data = render_preview(path, self.size)
+        if data is not None and self.directory:
+            self.store(key, data)
+        return data
+
+    def store(self, key: str, data: bytes):
+        entry = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, entry)
+        self._stores += 1
+        if self.max_disk_size and self._stores % EVICT_EVERY == 1:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_preview_cache: Optional[PreviewCache] = None
+
+
+def get_preview_cache() -> Optional[PreviewCache]:
+    """
+    Кэш миниатюр, настроенный по секции [preview], или None, если миниатюры выключены.
+    """
+    global _preview_cache
+    from src.config import config
+
+    if not config.preview.enabled:
+        return None
+    if _preview_cache is None:
+        settings = config.preview
+        directory = None
+        if settings.disk_cache:
+            directory = settings.directory or os.path.join(os.path.dirname(default_cache_dir()), 'previews')
+        _preview_cache = PreviewCache(directory, settings.size, settings.memory_items, settings.disk_max_mb * 1024 ** 2)
+    return _preview_cache
+
+
+async def get_preview(path: str) -> Optional[bytes]:
+    cache = get_preview_cache()
+    if cache is None:
+        return None
+    return await cache.get(path)
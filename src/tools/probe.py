@@ -0,0 +1,113 @@
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+
+# Передаточные характеристики HDR в нумерации ffmpeg (AVColorTransferCharacteristic)
+HDR_TRANSFERS = {16: 'pq', 18: 'hlg'}
+
+
+@dataclass(frozen=True)
+class VideoStreamInfo:
+    index: int
+    codec: str
+    width: int
+    height: int
+    fps: float
+    frames: int
+    bitrate: Optional[int]
+    pix_fmt: Optional[str]
+    hdr: Optional[str] = None  # 'pq', 'hlg' или None
+
+
+@dataclass(frozen=True)
+class AudioStreamInfo:
+    index: int
+    codec: str
+    channels: int
+    sample_rate: int
+    bitrate: Optional[int]
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    path: str
+    size: int
+    format_name: str
+    duration: float
+    bitrate: Optional[int]
+    video: Optional[VideoStreamInfo] = None
+    audio: tuple[AudioStreamInfo, ...] = field(default_factory=tuple)
+    subtitles: tuple[str, ...] = field(default_factory=tuple)
+
+    @property
+    def video_bitrate(self) -> Optional[int]:
+        """
+        Битрейт видеопотока, если контейнер его не хранит - оценка по размеру файла без аудио.
+        """
+        if self.video is None:
+            return None
+        if self.video.bitrate:
+            return self.video.bitrate
+        if not self.duration:
+            return None
+        audio = sum(stream.bitrate or 0 for stream in self.audio)
+        return max(int(self.size * 8 / self.duration) - audio, 0)
+
+
+def probe_media(path: str) -> MediaInfo:
+    """
+    Читает метаданные всех потоков файла за одно открытие.
+    Результат кэшируется по пути, времени изменения и размеру файла.
+    """
+    stat = os.stat(path)
+    return _probe(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=256)
+def _probe(path: str, mtime_ns: int, size: int) -> MediaInfo:
+    import av
+
+    with av.open(path) as container:
+        duration = container.duration / av.time_base if container.duration else 0.0
+        video = None
+        audio = []
+        subtitles = []
+        for stream in container.streams:
+            context = stream.codec_context
+            if stream.type == 'video' and video is None:
+                rate = stream.average_rate or stream.guessed_rate
+                fps = float(rate) if rate else 0.0
+                frames = stream.frames or int(duration * fps)
+                video = VideoStreamInfo(
+                    index=stream.index,
+                    codec=context.name,
+                    width=context.width,
+                    height=context.height,
+                    fps=fps,
+                    frames=frames,
+                    bitrate=stream.bit_rate or context.bit_rate or None,
+                    pix_fmt=context.pix_fmt,
+                    hdr=HDR_TRANSFERS.get(getattr(context, 'color_trc', None)),
+                )
+            elif stream.type == 'audio':
+                audio.append(AudioStreamInfo(
+                    index=stream.index,
+                    codec=context.name,
+                    channels=context.channels,
+                    sample_rate=context.sample_rate,
+                    bitrate=stream.bit_rate or context.bit_rate or None,
+                ))
+            elif stream.type == 'subtitle':
+                subtitles.append(context.name)
+
+        return MediaInfo(
+            path=path,
+            size=size,
+            format_name=container.format.name,
+            duration=duration,
+            bitrate=container.bit_rate or None,
+            video=video,
+            audio=tuple(audio),
+            subtitles=tuple(subtitles),
+        )
@@ -0,0 +1,165 @@
+import asyncio
+import math
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from src.logs.metrics import annotate, stage
+from src.utils.executor import get_executors
+from src.utils.progress import ProgressCallback, report
+
+PAGE_FORMATS = {'.png': 'png', '.jpg': 'jpg', '.jpeg': 'jpg'}
+ARCHIVE_FORMATS = ('.tiff', '.zip')
+
+# Документ, открытый в этом процессе пула: (путь, mtime_ns, размер, документ)
+_document = None
+
+
+def _open_document(pdf_path: str):
+    """
+    Каждый процесс пула держит открытым один документ и переиспользует его для всех своих частей.
+    """
+    global _document
+    import fitz
+
+    stat = os.stat(pdf_path)
+    key = (pdf_path, stat.st_mtime_ns, stat.st_size)
+    if _document is None or _document[:3] != key:
+        if _document is not None:
+            _document[3].close()
+        _document = (*key, fitz.open(pdf_path))
+    return _document[3]
+
+
+def page_name(stem: str, number: int, page_count: int, ext: str) -> str:
+    return f"{stem}-{number + 1:0{max(len(str(page_count)), 4)}d}{ext}"
+
+
+def pages_dir(output_path: str) -> str:
+    """
+    Папка, в которую сохраняются страницы, если их несколько, а output_path - .png/.jpg.
+    """
+    return os.path.splitext(output_path)[0] + '_pages'
+
+
+def render_pages(pdf_path: str, start: int, end: int, output_dir: str, stem: str, ext: str, dpi: int,
+                 quality: int) -> list[str]:
+    """
+    Отрисовывает страницы [start, end) и сразу записывает каждую на диск,
+    поэтому в памяти процесса не больше одной страницы.
+    """
+    doc = _open_document(pdf_path)
+    paths = []
+    for number in range(start, end):
+        pix = doc[number].get_pixmap(dpi=dpi, alpha=False)
+        path = os.path.join(output_dir, page_name(stem, number, doc.page_count, ext))
+        if PAGE_FORMATS[ext] == 'jpg':
+            pix.save(path, output='jpg', jpg_quality=quality)
+        else:
+            pix.save(path, output='png')
+        paths.append(path)
+    return paths
+
+
+def write_tiff(pages: list[str], output_path: str):
+    """
+    Многостраничный TIFF, страницы дописываются по одной без загрузки всех в память.
+    """
+    from PIL import Image, TiffImagePlugin
+
+    with TiffImagePlugin.AppendingTiffWriter(output_path, True) as tiff:
+        for page in pages:
+            with Image.open(page) as img:
+                img.save(tiff, 'TIFF', compression='tiff_deflate')
+            tiff.newFrame()
+
+
+def append_to_zip(archive, pages: list[str]):
+    for page in pages:
+        # PNG и JPEG уже сжаты, повторное сжатие только тратит время
+        archive.write(page, os.path.basename(page))
+
+
+async def rasterize_pdf(pdf_path: str, output_path: str, dpi: int = 150, quality: int = 90,
+                        pages: Optional[range] = None, chunk_pages: int = 8,
+                        progress: ProgressCallback = None) -> str:
+    """
+    Сохраняет страницы PDF как изображения. Части страниц отрисовываются параллельно в пуле процессов,
+    готовые страницы записываются на диск сразу.
+    output_path с расширением .png/.jpg: одна страница - этот файл, несколько - папка с именем без расширения
+    и суффиксом _pages. .tiff - многостраничный TIFF, .zip - архив PNG.
+    Возвращает путь к файлу или папке с результатом. progress считается в страницах.
+    """
+    import fitz
+
+    executors = get_executors()
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext not in PAGE_FORMATS and ext not in ARCHIVE_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат страниц {ext}.")
+
+    with stage("probe"), fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    pages = pages if pages is not None else range(page_count)
+    annotate(pages=len(pages))
+
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    page_ext = ext if ext in PAGE_FORMATS else '.png'
+    # Архив и единственная страница собираются во временной папке, чтобы не задеть файлы рядом с результатом
+    single = ext in PAGE_FORMATS and len(pages) == 1
+    workdir = None
+    if ext in ARCHIVE_FORMATS or single:
+        workdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix=".konvera-pages-")
+        output_dir = workdir
+    else:
+        output_dir = pages_dir(output_path)
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Мелкие части выравнивают нагрузку между процессами, но не мельче одной страницы
+    chunk = max(min(chunk_pages, math.ceil(len(pages) / (executors.processes * 4))), 1)
+    ranges = [(pages[index], pages[min(index + chunk, len(pages)) - 1] + 1) for index in range(0, len(pages), chunk)]
+    limit = asyncio.Semaphore(executors.processes)
+
+    async def render(start: int, end: int) -> list[str]:
+        async with limit:
+            return await executors.run_in_process(
+                render_pages, pdf_path, start, end, output_dir, stem, page_ext, dpi, quality
+            )
+
+    archive = None
+    if ext == '.zip':
+        import zipfile
+
+        archive = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED)
+
+    done = 0
+    rendered = []
+    report(progress, done, len(pages))
+    tasks = [asyncio.ensure_future(render(start, end)) for start, end in ranges]
+    try:
+        with stage("encode"):
+            for chunk_task in asyncio.as_completed(tasks):
+                paths = await chunk_task
+                rendered.extend(paths)
+                if archive is not None:
+                    # Архив пополняется по мере готовности частей, не дожидаясь всего документа
+                    await executors.run_in_thread(append_to_zip, archive, paths)
+                done += len(paths)
+                report(progress, done, len(pages))
+
+        if ext == '.tiff':
+            with stage("write"):
+                await executors.run_in_thread(write_tiff, sorted(rendered), output_path)
+        elif single:
+            os.replace(rendered[0], output_path)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if archive is not None:
+            archive.close()
+        if workdir is not None:
+            await executors.run_in_thread(shutil.rmtree, workdir, True)
+
+    if output_dir is not None and workdir is None:
+        return output_dir
+    return output_path
@@ -0,0 +1,146 @@
+import os
+
+import av
+
+from src.utils.executor import CancelToken
+from src.utils.progress import ProgressCallback, report
+
+
+class VideoRemuxer:
+    """
+    Перепаковка видео в другой контейнер.
+    Потоки, кодек которых принимает целевой контейнер, копируются пакетами без декодирования,
+    остальные перекодируются. Потоки, которые контейнер не поддерживает вовсе, отбрасываются.
+    """
+    # Кодеки, которые контейнер принимает без перекодирования (None - принимает любой кодек этого типа)
+    container_codecs = {
+        '.mp4': {
+            'video': {'h264', 'hevc', 'mpeg4', 'av1', 'vp9'},
+            'audio': {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'alac', 'flac'},
+            'subtitle': {'mov_text'},
+        },
+        '.mov': {
+            'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'},
+            'audio': {'aac', 'mp3', 'ac3', 'alac', 'pcm_s16le', 'pcm_s24le'},
+            'subtitle': {'mov_text'},
+        },
+        '.mkv': {
+            'video': None,
+            'audio': None,
+            'subtitle': {'subrip', 'ass', 'ssa', 'webvtt', 'hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle'},
+        },
+        '.avi': {
+            'video': {'mpeg4', 'h264', 'mjpeg', 'msmpeg4v2', 'msmpeg4v3'},
+            'audio': {'mp3', 'ac3', 'pcm_s16le'},
+            'subtitle': set(),
+        },
+    }
+    # Кодеки, в которые перекодируются потоки, не подходящие контейнеру
+    transcode_codecs = {
+        '.mp4': {'video': 'libx264', 'audio': 'aac'},
+        '.mov': {'video': 'libx264', 'audio': 'aac'},
+        '.mkv': {'video': 'libx264', 'audio': 'aac'},
+        '.avi': {'video': 'mpeg4', 'audio': 'libmp3lame'},
+    }
+
+    @classmethod
+    def stream_action(cls, stream, target_format: str, force_transcode: bool = False) -> str:
+        """
+        Определяет, что делать с потоком при записи в target_format: 'copy', 'transcode' или 'drop'.
+        """
+        if stream.type not in ('video', 'audio', 'subtitle'):
+            return 'drop'
+
+        accepted = cls.container_codecs[target_format][stream.type]
+        codec_name = stream.codec_context.name
+        if not force_transcode and (accepted is None or codec_name in accepted):
+            return 'copy'
+        if stream.type in cls.transcode_codecs[target_format]:
+            return 'transcode'
+        return 'drop'
+
+    @classmethod
+    def remux(cls, input_path: str, output_path: str, force_transcode: bool = False, cancel: CancelToken = None,
+              progress: ProgressCallback = None):
+        """
+        Перепаковывает input_path в контейнер output_path.
+        Если force_transcode задан, все видео- и аудиопотоки перекодируются.
+        Флаг cancel проверяется на каждом пакете, прогресс считается в кадрах основного видеопотока.
+        """
+        target_format = os.path.splitext(output_path)[1].lower()
+        if target_format not in cls.container_codecs:
+            raise ValueError(f"Перепаковка в формат {target_format} не поддерживается.")
+
+        with av.open(input_path) as source, av.open(output_path, 'w') as output:
+            plans = {}
+            for stream in source.streams:
+                action = cls.stream_action(stream, target_format, force_transcode)
+                if action == 'copy':
+                    plans[stream.index] = (action, output.add_stream_from_template(stream))
+                elif action == 'transcode':
+                    plans[stream.index] = (action, cls._add_encoder(output, stream, target_format))
+
+            if not plans:
+                raise ValueError(f"В файле {input_path} нет потоков, которые можно записать в {target_format}.")
+
+            selected = [stream for stream in source.streams if stream.index in plans]
+            main_video = next((stream for stream in selected if stream.type == 'video'), None)
+            total_frames = cls.frame_count(source, main_video) if main_video is not None else 0
+            frames = 0
+            for packet in source.demux(selected):
+                if cancel is not None:
+                    cancel.check()
+                action, out_stream = plans[packet.stream.index]
+                is_main = main_video is not None and packet.stream.index == main_video.index
+                if action == 'copy':
+                    # Пустые пакеты в конце демультиплексирования не записываются
+                    if packet.dts is None:
+                        continue
+                    packet.stream = out_stream
+                    output.mux(packet)
+                else:
+                    # Пустой пакет сбрасывает буфер декодера, поэтому декодируется всегда
+                    for frame in packet.decode():
+                        output.mux(out_stream.encode(frame))
+
+                if is_main:
+                    frames += 1
+                    report(progress, min(frames, total_frames), total_frames)
+
+            for action, out_stream in plans.values():
+                if action == 'transcode':
+                    output.mux(out_stream.encode(None))
+        report(progress, total_frames, total_frames)
+        return output_path
+
+    @staticmethod
+    def frame_count(container, stream) -> int:
+        """
+        Число кадров видеопотока из метаданных, при их отсутствии - оценка по длительности и частоте кадров.
+        """
+        if stream.frames:
+            return stream.frames
+        rate = stream.average_rate or stream.guessed_rate or 25
+        if stream.duration is not None and stream.time_base is not None:
+            seconds = float(stream.duration * stream.time_base)
+        elif container.duration is not None:
+            seconds = container.duration / av.time_base
+        else:
+            return 0
+        return max(int(seconds * rate), 1)
+
+    @classmethod
+    def _add_encoder(cls, output, stream, target_format: str):
+        codec = cls.transcode_codecs[target_format][stream.type]
+        if stream.type == 'video':
+            out_stream = output.add_stream(codec, rate=stream.average_rate or stream.guessed_rate or 25)
+            out_stream.width = stream.codec_context.width
+            out_stream.height = stream.codec_context.height
+            out_stream.pix_fmt = 'yuv420p'
+            # Временная база исходного потока позволяет передавать кадры в кодер без пересчёта pts
+            out_stream.codec_context.time_base = stream.time_base
+            return out_stream
+
+        out_stream = output.add_stream(codec, rate=stream.codec_context.sample_rate or 48000)
+        out_stream.layout = stream.codec_context.layout.name
+        return out_stream
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from src.tools.formats import conversion_graph, media_type
+
+# Скорость по умолчанию, пока для способа нет замеров: единиц работы в секунду.
+# Единицы: видео - мегапиксели кадров, изображения - мегапиксели, PDF - страницы, прочие документы - МБ
+DEFAULT_RATES = {'video': 60.0, 'image': 40.0, 'pdf': 4.0, 'document': 2.0}
+# Перепаковка видео копирует пакеты без декодирования
+DEFAULT_BACKEND_RATES = {'remux': 3000.0, 'document_copy': 500.0}
+# Вес нового замера в скользящем среднем скорости
+LEARNING_RATE = 0.3
+# Задача, выполненная во столько раз быстрее оценки, скорее всего взята из кэша и не учитывается
+CACHE_HIT_SPEEDUP = 20
+# Сколько секунд задача в начале очереди ждёт, пока меньшие задачи занимают освободившиеся ресурсы
+MAX_BACKFILL_WAIT = 30.0
+# Как часто выученные скорости сохраняются на диск при поштучных задачах
+SAVE_INTERVAL = 10.0
+
+
+@dataclass(frozen=True)
+class JobEstimate:
+    """
+    Оценка задачи: backend - ключ, по которому учится скорость, work - объём работы в единицах этого способа,
+    seconds - ожидаемое время, memory - ожидаемая память в байтах, cpu - сколько ядер задача займёт.
+    """
+    backend: str
+    work: float
+    seconds: float
+    memory: int
+    cpu: float
+
+
+def physical_memory() -> Optional[int]:
+    if sys.platform == "win32":
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(status)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None
+        return status.ullTotalPhys
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def backend_key(job) -> str:
+    """
+    Ключ способа обработки: для конвертации - цепочка способов из графа форматов, для сжатия - тип файла.
+    """
+    ext = os.path.splitext(job.input_path)[1].lower()
+    if job.action == 'convert':
+        plan = conversion_graph().plan(ext, job.target_format) or ()
+        if plan:
+            return 'convert:' + '+'.join(step.backend.name for step in plan)
+    kind = 'pdf' if ext == '.pdf' else media_type(job.input_path)
+    return f'{job.action}:{kind}'
+
+
+def measure_work(job) -> tuple[str, float, int, float]:
+    """
+    Объём работы, память и число ядер задачи по метаданным файла: длительность и разрешение видео,
+    число мегапикселей изображения, число страниц PDF, размер прочих документов.
+    Читаются только заголовки файлов. Возвращает (единица, работа, память, ядра).
+    """
+    size = os.path.getsize(job.input_path)
+    ext = os.path.splitext(job.input_path)[1].lower()
+    kind = media_type(job.input_path)
+    cpu_count = os.cpu_count() or 1
+
+    if kind == 'video':
+        from src.tools.probe import probe_media
+
+        info = probe_media(job.input_path)
+        if info.video is None:
+            return 'video', size / 1024 ** 2, 64 * 1024 ** 2, 1.0
+        pixels = info.video.width * info.video.height
+        frames = info.video.frames or info.duration * (info.video.fps or 30)
+        # Кодировщик держит в памяти десятки кадров (опережающий анализ и опорные кадры)
+        memory = int(pixels * 1.5 * 64) + 128 * 1024 ** 2
+        return 'video', frames * pixels / 1e6, memory, float(min(cpu_count, 8))
+
+    if kind == 'image':
+        from PIL import Image
+
+        with Image.open(job.input_path) as img:
+            frames = getattr(img, 'n_frames', 1) if ext == '.gif' else 1
+            pixels = img.width * img.height
+        # Декодированное изображение, его копия при преобразовании и буфер кодировщика
+        return 'image', pixels * frames / 1e6, pixels * 4 * 3 + 32 * 1024 ** 2, 1.0
+
+    if ext == '.pdf':
+        import fitz
+
+        with fitz.open(job.input_path) as doc:
+            pages = doc.page_count
+        # Страницы разбираются частями в пуле процессов
+        workers = min(max(pages // 10, 1), cpu_count)
+        return 'pdf', float(max(pages, 1)), 160 * 1024 ** 2 * workers, float(workers)
+
+    return 'document', size / 1024 ** 2, 256 * 1024 ** 2, 1.0
+
+
+class ThroughputModel:
+    """
+    Выученная скорость каждого способа обработки (единиц работы в секунду) по прошлым задачам.
+    Хранится в JSON, новые замеры входят в скользящее среднее с весом LEARNING_RATE.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.rates: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if path and os.path.isfile(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.rates = json.load(f)
+            except (OSError, ValueError):
+                # Повреждённый файл - скорости выучатся заново
+                self.rates = {}
+
+    def rate(self, backend: str, unit: str) -> float:
+        learned = self.rates.get(backend)
+        if learned:
+            return learned["rate"]
+        for name, rate in DEFAULT_BACKEND_RATES.items():
+            if name in backend.split(':')[-1].split('+'):
+                return rate
+        return DEFAULT_RATES[unit]
+
+    def observe(self, backend: str, work: float, seconds: float):
+        if work <= 0 or seconds <= 0:
+            return
+        rate = work / seconds
+        with self._lock:
+            learned = self.rates.get(backend)
+            if learned is None:
+                self.rates[backend] = {"rate": rate, "runs": 1}
+            else:
+                learned["rate"] += LEARNING_RATE * (rate - learned["rate"])
+                learned["runs"] += 1
+            self._dirty = True
+
+    def save(self, force: bool = True):
+        """
+        Записывает скорости через временный файл. force=False - не чаще раза в SAVE_INTERVAL секунд.
+        """
+        if not self.path or not self._dirty:
+            return
+        if not force and time.monotonic() - self._saved_at < SAVE_INTERVAL:
+            return
+        with self._lock:
+            data = json.dumps(self.rates, indent=2, sort_keys=True)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+class CostScheduler:
+    """
+    Порядок и допуск задач по оценке стоимости.
+    Задача запускается, когда её оценки ядер и памяти помещаются в бюджет вместе с уже выполняющимися.
+    Ожидающие задачи допускаются в порядке политики: 'sjf' - сначала короткие (быстрый отклик
+    для перетаскиваемых файлов), 'lpt' - сначала длинные (меньше общее время пакета: короткие задачи
+    заполняют ядра в конце). Если первая задача не помещается, следующие, которые помещаются, могут её
+    обойти, но не дольше MAX_BACKFILL_WAIT секунд, чтобы большие задачи не ждали бесконечно.
+    Задача, которая больше всего бюджета, выполняется, когда остальные завершились.
+    """
+
+    def __init__(self, cpu_budget: float, memory_budget: int, model: ThroughputModel):
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.model = model
+        self.used_cpu = 0.0
+        self.used_memory = 0
+        self.running = 0
+        self._waiters: list[tuple[float, int, JobEstimate, asyncio.Future, float]] = []
+        self._counter = 0
+
+    def estimate(self, job) -> JobEstimate:
+        """
+        Оценка по метаданным файла. Читает заголовки, поэтому вызывается из пула потоков.
+        """
+        backend = backend_key(job)
+        try:
+            unit, work, memory, cpu = measure_work(job)
+        except Exception:
+            # Файл не читается - ошибку покажет сама задача, а оценка берётся по размеру
+            size = os.path.getsize(job.input_path) if os.path.isfile(job.input_path) else 0
+            unit, work, memory, cpu = 'document', size / 1024 ** 2, 256 * 1024 ** 2, 1.0
+        seconds = work / self.model.rate(backend, unit)
+        return JobEstimate(backend, work, seconds, memory, min(cpu, self.cpu_budget))
+
+    async def estimate_all(self, jobs: list) -> list[JobEstimate]:
+        from src.utils.executor import get_executors
+
+        executors = get_executors()
+        return list(await asyncio.gather(*(executors.run_in_thread(self.estimate, job) for job in jobs)))
+
+    @staticmethod
+    def order(estimates: list[JobEstimate], policy: str) -> list[int]:
+        """
+        Индексы задач в порядке запуска по политике.
+        """
+        indexes = range(len(estimates))
+        if policy == 'lpt':
+            return sorted(indexes, key=lambda index: -estimates[index].seconds)
+        return sorted(indexes, key=lambda index: estimates[index].seconds)
+
+    def fits(self, estimate: JobEstimate) -> bool:
+        if self.running == 0:
+            return True
+        return (self.used_cpu + estimate.cpu <= self.cpu_budget
+                and self.used_memory + estimate.memory <= self.memory_budget)
+
+    def _wake(self):
+        self._waiters.sort(key=lambda waiter: waiter[:2])
+        now = time.monotonic()
+        for waiter in list(self._waiters):
+            _, _, estimate, future, queued_at = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self.fits(estimate):
+                self._waiters.remove(waiter)
+                self._acquire(estimate)
+                future.set_result(None)
+            elif now - queued_at > MAX_BACKFILL_WAIT:
+                # Первая задача ждёт слишком долго: ресурсы копятся для неё
+                break
+
+    def _acquire(self, estimate: JobEstimate):
+        self.used_cpu += estimate.cpu
+        self.used_memory += estimate.memory
+        self.running += 1
+
+    def _release(self, estimate: JobEstimate):
+        self.used_cpu -= estimate.cpu
+        self.used_memory -= estimate.memory
+        self.running -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, estimate: JobEstimate, policy: str = 'sjf'):
+        """
+        Ждёт, пока задача поместится в бюджет, и держит её ресурсы до выхода из блока.
+        """
+        if not self._waiters and self.fits(estimate):
+            self._acquire(estimate)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._counter += 1
+            priority = -estimate.seconds if policy == 'lpt' else estimate.seconds
+            self._waiters.append((priority, self._counter, estimate, future, time.monotonic()))
+            self._wake()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Место уже выделено, но задача отменена - освобождаем его для следующих
+                    self._release(estimate)
+                raise
+        try:
+            yield
+        finally:
+            self._release(estimate)
+
+    def learn(self, estimate: JobEstimate, seconds: float, fields: Optional[dict] = None):
+        """
+        Уточняет пропускную способность по фактической длительности задачи.
+        Результат из кэша и видео, скопированное без перекодирования, о скорости кодирования ничего не говорят.
+        """
+        fields = fields or {}
+        if fields.get('cache') == 'hit' or fields.get('reencoded') is False:
+            return
+        if seconds * CACHE_HIT_SPEEDUP < estimate.seconds:
+            return
+        self.model.observe(estimate.backend, estimate.work, seconds)
+
+
+_scheduler: Optional[CostScheduler] = None
+
+
+def default_model_path() -> str:
+    from src.tools.cache import default_cache_dir
+
+    return os.path.join(os.path.dirname(default_cache_dir()), "throughput.json")
+
+
+def get_scheduler() -> Optional[CostScheduler]:
+    """
+    Общий планировщик по секции [scheduler] или None, если он выключен.
+    Один на процесс, чтобы бюджет учитывал задачи всех очередей (пакет, наблюдение за папками, сервер).
+    """
+    global _scheduler
+    from src.config import config
+
+    settings = config.scheduler
+    if not settings.enabled:
+        return None
+    if _scheduler is None:
+        memory = settings.memory_budget_mb * 1024 ** 2
+        if not memory:
+            # Половина физической памяти: остальное нужно системе и самому приложению
+            memory = (physical_memory() or 8 * 1024 ** 3) // 2
+        _scheduler = CostScheduler(
+            settings.cpu_budget or os.cpu_count() or 1, memory,
+            ThroughputModel(settings.model_path or default_model_path()),
+        )
+    return _scheduler
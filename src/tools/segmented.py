@@ -0,0 +1,122 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from src.logs.metrics import stage
+from src.tools.ffmpeg_pipeline import SUBTITLE_CODECS, run_ffmpeg, video_threads
+from src.tools.probe import MediaInfo
+from src.utils.executor import get_executors
+from src.utils.progress import ProgressCallback, report
+
+# Сколько потоков libx264 получает один сегмент: меньше - кодер хуже загружает ядра, больше - мало сегментов
+THREADS_PER_SEGMENT = 4
+
+
+def count_video_packets(path: str) -> int:
+    """
+    Число кадров первого видеопотока по пакетам контейнера, без декодирования.
+    """
+    import av
+
+    with av.open(path) as container:
+        if not container.streams.video:
+            return 0
+        # Пустые пакеты сбрасывают декодер в конце потока и кадрами не являются
+        return sum(1 for packet in container.demux(container.streams.video[0]) if packet.size)
+
+
+def plan_segments(duration: float, min_segment_seconds: float, cpu_count: int = None) -> int:
+    """
+    Число сегментов для параллельного кодирования: по одному на THREADS_PER_SEGMENT ядер,
+    но не короче min_segment_seconds каждый.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    by_cores = max(cpu_count // THREADS_PER_SEGMENT, 1)
+    by_duration = int(duration // max(min_segment_seconds, 1))
+    return max(min(by_cores, by_duration), 1)
+
+
+async def encode_segmented(input_path: str, output_path: str, info: MediaInfo, crf: str, preset: str,
+                           segments: int, progress: ProgressCallback = None) -> Optional[str]:
+    """
+    Кодирует длинное видео параллельно по сегментам.
+    Видео режется без перекодирования по ключевым кадрам, сегменты кодируются одновременно
+    с одинаковыми crf/preset, затем склеиваются без потерь вместе с исходными аудио и субтитрами.
+    Если в результате не столько кадров, сколько в исходнике, он удаляется и возвращается None:
+    такое видео нужно кодировать целиком.
+    """
+    executors = get_executors()
+    ext = os.path.splitext(output_path)[1].lower()
+    total_frames = info.video.frames if info.video else 0
+    # threads из [video] задаётся на один процесс ffmpeg, без него ядра делятся между сегментами поровну
+    threads = video_threads() or max((os.cpu_count() or 1) // segments, 1)
+
+    workdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix=".konvera-segments-")
+    try:
+        # Сегмент начинается с ключевого кадра, поэтому фактическая длина может немного отличаться
+        # NUT хранит исходную шкалу времени: в MKV (1 мс) с reset_timestamps теряются кадры.
+        # genpts нужен исходникам без pts, например AVI, иначе сегменты не записываются
+        with stage("split"):
+            source_frames, _ = await asyncio.gather(
+                executors.run_in_thread(count_video_packets, input_path),
+                executors.run_in_thread(
+                    run_ffmpeg, [(input_path, {'fflags': '+genpts'})], os.path.join(workdir, 'source%05d.nut'),
+                    {
+                        'map': '0:v:0',
+                        'codec': 'copy',
+                        'f': 'segment',
+                        'segment_time': f"{info.duration / segments:.3f}",
+                        'reset_timestamps': 1,
+                    },
+                    cancellable=True,
+                ),
+            )
+        sources = sorted(name for name in os.listdir(workdir) if name.startswith('source'))
+
+        done = {}
+
+        def segment_progress(index: int):
+            def callback(frames: int, _total: int):
+                done[index] = frames
+                report(progress, min(sum(done.values()), total_frames), total_frames)
+            return callback
+
+        encoded = [os.path.join(workdir, name.replace('source', 'encoded')) for name in sources]
+        with stage("encode"):
+            await asyncio.gather(*(
+                executors.run_in_thread(
+                    run_ffmpeg, [(os.path.join(workdir, source), {})], target,
+                    {'codec:v': 'libx264', 'crf': crf, 'preset': preset, 'threads': threads},
+                    0, segment_progress(index), cancellable=True,
+                )
+                for index, (source, target) in enumerate(zip(sources, encoded))
+            ))
+
+        concat_list = os.path.join(workdir, 'segments.txt')
+        with open(concat_list, 'w', encoding='utf-8') as f:
+            # В списке concat одинарная кавычка внутри пути экранируется как '\''
+            f.writelines("file '{}'\n".format(path.replace("'", "'\\''")) for path in encoded)
+
+        options = {'map': ['0:v:0', '1:a?'], 'codec:v': 'copy', 'codec:a': 'copy'}
+        if ext in SUBTITLE_CODECS:
+            options['map'].append('1:s?')
+            options['codec:s'] = SUBTITLE_CODECS[ext]
+        if ext in ('.mp4', '.mov'):
+            options['movflags'] = '+faststart'
+        with stage("write"):
+            await executors.run_in_thread(
+                run_ffmpeg, [(concat_list, {'f': 'concat', 'safe': 0}), (input_path, {'fflags': '+genpts'})],
+                output_path, options, cancellable=True,
+            )
+            output_frames = await executors.run_in_thread(count_video_packets, output_path)
+    finally:
+        await executors.run_in_thread(shutil.rmtree, workdir, True)
+
+    if output_frames != source_frames:
+        # Кодирование целиком даёт ровно столько кадров, сколько в исходнике
+        await executors.run_in_thread(os.remove, output_path)
+        return None
+    report(progress, total_frames, total_frames)
+    return output_path
@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from src.tools.probe import MediaInfo
+
+# Кодеки, которые при том же битрейте заметно эффективнее H.264
+EFFICIENT_CODECS = {'hevc', 'av1', 'vp9'}
+# Примерный битрейт libx264 в битах на пиксель кадра при crf 23; каждые +6 crf вдвое меньше
+H264_BITS_PER_PIXEL_CRF23 = 0.1
+
+
+@dataclass(frozen=True)
+class VideoEncodingSettings:
+    crf: str
+    preset: str
+
+
+def expected_h264_bitrate(width: int, height: int, fps: float, crf: int) -> int:
+    """
+    Оценка битрейта libx264 для кадра width x height при заданном crf.
+    """
+    bits_per_pixel = H264_BITS_PER_PIXEL_CRF23 * 2 ** ((23 - crf) / 6)
+    return int(width * height * (fps or 25) * bits_per_pixel)
+
+
+def choose_video_settings(info: MediaInfo) -> Optional[VideoEncodingSettings]:
+    """
+    Подбирает crf и preset по разрешению видео.
+    Возвращает None, если перекодирование не уменьшит файл: исходный битрейт уже не выше
+    ожидаемого битрейта libx264, а для HEVC/AV1/VP9 - не выше удвоенного.
+    HDR тоже не перекодируется: 8-битный libx264 потерял бы передаточную функцию и широкий цветовой охват.
+    """
+    video = info.video
+    if video is None or video.hdr:
+        return None
+
+    if video.width >= 1920 or video.height >= 1080:
+        crf, preset = 28, 'slow'
+    elif video.width >= 1280 or video.height >= 720:
+        crf, preset = 23, 'medium'
+    else:
+        crf, preset = 18, 'fast'
+
+    expected = expected_h264_bitrate(video.width, video.height, video.fps, crf)
+    current = info.video_bitrate
+    if current:
+        limit = expected * 2 if video.codec in EFFICIENT_CODECS else expected
+        if current <= limit:
+            return None
+    return VideoEncodingSettings(str(crf), preset)
@@ -0,0 +1,438 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import sqlite3
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from src.tools.batch import BatchJob, BatchQueue, output_path_for
+from src.tools.cache import ResultCache, default_cache_dir
+from src.tools.formats import media_type
+from src.tools.rasterize import pages_dir
+from src.utils.executor import get_executors
+
+# Флаги inotify из <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+@dataclass(frozen=True)
+class WatchRule:
+    """
+    Что делать с файлами с расширениями extensions: action - 'convert' или 'optimize'.
+    """
+    extensions: tuple[str, ...]
+    action: str
+    target_format: Optional[str] = None
+    options: dict = field(default_factory=dict, hash=False)
+
+    def matches(self, path: str) -> bool:
+        return os.path.splitext(path)[1].lower() in self.extensions
+
+
+def default_state_path() -> str:
+    return os.path.join(os.path.dirname(default_cache_dir()), "watch.sqlite3")
+
+
+def with_ancestors(path: str) -> list[str]:
+    """
+    Путь и все папки, в которых он лежит.
+    """
+    paths = [path]
+    parent = os.path.dirname(path)
+    while parent and parent != paths[-1]:
+        paths.append(parent)
+        parent = os.path.dirname(parent)
+    return paths
+
+
+def walk_files(root: str, recursive: bool = True) -> Iterable[str]:
+    for current, dirs, names in os.walk(root):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        yield from (os.path.join(current, name) for name in sorted(names))
+        if not recursive:
+            break
+
+
+class WatchState:
+    """
+    Состояние исходных файлов между запусками: mtime, размер, хэш содержимого и итог обработки.
+    Хранится в SQLite и используется только из потока цикла событий.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                output TEXT,
+                processed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY);
+        """)
+
+    def get(self, path: str) -> Optional[tuple[int, int, str, str]]:
+        """
+        (mtime_ns, size, hash, status) последней обработки файла или None.
+        """
+        return self.db.execute(
+            "SELECT mtime_ns, size, hash, status FROM files WHERE path = ?", (path,)
+        ).fetchone()
+
+    def record(self, path: str, mtime_ns: int, size: int, digest: str, status: str, output: Optional[str] = None):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, mtime_ns, size, digest, status, output, time.time()),
+            )
+            if output:
+                self.db.execute("INSERT OR IGNORE INTO outputs VALUES (?)", (output,))
+
+    def touch(self, path: str, mtime_ns: int):
+        with self.db:
+            self.db.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (mtime_ns, path))
+
+    def is_output(self, path: str) -> bool:
+        """
+        Путь - результат обработки или лежит внутри папки-результата (например, страницы PDF в _pages).
+        """
+        candidates = with_ancestors(path)
+        query = f"SELECT 1 FROM outputs WHERE path IN ({', '.join('?' * len(candidates))}) LIMIT 1"
+        return self.db.execute(query, candidates).fetchone() is not None
+
+    def close(self):
+        self.db.close()
+
+
+class InotifyWatcher:
+    """
+    Наблюдение через inotify (только Linux). Дескриптор читается прямо в цикле событий через add_reader,
+    поэтому отдельный поток не нужен. Новые папки добавляются в наблюдение по мере появления.
+    """
+
+    def __init__(self, on_change: Callable[[str], None], on_overflow: Callable[[], None]):
+        self.on_change = on_change
+        self.on_overflow = on_overflow
+        self.fd = None
+        self.paths: dict[int, str] = {}
+        self.recursive = True
+        self._libc = None
+
+    @staticmethod
+    def available() -> bool:
+        return sys.platform.startswith('linux')
+
+    def start(self, roots: Iterable[str], recursive: bool = True):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.fd = fd
+        self.recursive = recursive
+        for root in roots:
+            self.add_tree(root)
+        asyncio.get_running_loop().add_reader(self.fd, self._read)
+
+    def add_tree(self, root: str):
+        for current, dirs, _ in os.walk(root):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            self.add_watch(current)
+            if not self.recursive:
+                break
+
+    def add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+        self.paths[wd] = path
+
+    def _read(self):
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._handle(wd, mask, name)
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            # Очередь ядра переполнилась, часть событий потеряна
+            self.on_overflow()
+            return
+        if mask & IN_IGNORED:
+            self.paths.pop(wd, None)
+            return
+        directory = self.paths.get(wd)
+        if directory is None or not name:
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith('.'):
+                self.add_tree(path)
+                # Файлы могли появиться до того, как папка попала под наблюдение
+                for file in walk_files(path, self.recursive):
+                    self.on_change(file)
+            return
+        self.on_change(path)
+
+    def stop(self):
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+            self.paths.clear()
+
+
+class PollingWatcher:
+    """
+    Запасной вариант без inotify: папки периодически обходятся в пуле потоков,
+    о новых и изменившихся по mtime или размеру файлах сообщается on_change.
+    """
+
+    def __init__(self, on_change: Callable[[str], None], interval: float):
+        self.on_change = on_change
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, roots: Iterable[str], recursive: bool = True):
+        self._task = asyncio.get_running_loop().create_task(self._poll(list(roots), recursive))
+
+    @staticmethod
+    def snapshot(roots: list[str], recursive: bool) -> dict[str, tuple[int, int]]:
+        result = {}
+        for root in roots:
+            for path in walk_files(root, recursive):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result[path] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    async def _poll(self, roots: list[str], recursive: bool):
+        executors = get_executors()
+        previous = await executors.run_in_thread(self.snapshot, roots, recursive)
+        while True:
+            await asyncio.sleep(self.interval)
+            current = await executors.run_in_thread(self.snapshot, roots, recursive)
+            for path, signature in current.items():
+                if previous.get(path) != signature:
+                    self.on_change(path)
+            previous = current
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class WatchService:
+    """
+    Обрабатывает файлы, которые появляются в наблюдаемых папках, по правилам rules.
+    Файл попадает в обработку, когда он не меняется debounce секунд. После перезапуска
+    обрабатываются только новые и изменившиеся файлы: неизменные по mtime и размеру пропускаются
+    сразу, а при совпадении хэша содержимого обновляется только mtime в базе состояния.
+    """
+
+    def __init__(self, directories: Iterable[str], rules: Iterable[WatchRule], output_dir: Optional[str] = None,
+                 recursive: bool = True, debounce: float = 2.0, poll_interval: float = 5.0,
+                 use_inotify: bool = True, state_path: Optional[str] = None, queue: Optional[BatchQueue] = None,
+                 on_job_done: Optional[Callable[[BatchJob], None]] = None):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.rules = list(rules)
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.recursive = recursive
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.state_path = state_path or default_state_path()
+        self.queue = queue or BatchQueue()
+        self.on_job_done = on_job_done
+
+        self.state: Optional[WatchState] = None
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._signatures: dict[str, tuple[int, int]] = {}
+        self._active: set[str] = set()
+        self._expected_outputs: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_config(cls, directories: Iterable[str] = (), output_dir: Optional[str] = None, **kwargs) -> 'WatchService':
+        from src.config import config
+
+        rules = [
+            WatchRule(
+                tuple(ext.lower() for ext in rule.extensions), rule.action,
+                rule.format.lower() or None, dict(rule.options),
+            )
+            for rule in config.watch.rules
+        ]
+        kwargs.setdefault('recursive', config.watch.recursive)
+        kwargs.setdefault('debounce', config.watch.debounce)
+        kwargs.setdefault('poll_interval', config.watch.poll_interval)
+        kwargs.setdefault('use_inotify', config.watch.use_inotify)
+        kwargs.setdefault('state_path', config.watch.state_db or None)
+        return cls(
+            list(directories) or config.watch.directories, rules,
+            output_dir or config.watch.output_dir or None, **kwargs,
+        )
+
+    def rule_for(self, path: str) -> Optional[WatchRule]:
+        return next((rule for rule in self.rules if rule.matches(path)), None)
+
+    def is_ignored(self, path: str) -> bool:
+        # Скрытые файлы - это в том числе временные файлы самой программы (.konvera-*)
+        if os.path.basename(path).startswith('.') or not media_type(path):
+            return True
+        if any(candidate in self._expected_outputs for candidate in with_ancestors(path)):
+            return True
+        return self.state.is_output(path)
+
+    async def run(self):
+        """
+        Наблюдает за папками до отмены задачи.
+        """
+        if not self.directories:
+            raise ValueError("Не указаны папки для наблюдения.")
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                raise ValueError(f"Папка {directory} не найдена.")
+
+        self.state = WatchState(self.state_path)
+        watcher = self._make_watcher()
+        try:
+            try:
+                watcher.start(self.directories, self.recursive)
+            except OSError:
+                # Например, исчерпан fs.inotify.max_user_watches
+                watcher.stop()
+                watcher = PollingWatcher(self.notify, self.poll_interval)
+                watcher.start(self.directories, self.recursive)
+            # Файлы, которые появились или изменились, пока сервис не работал
+            await self.rescan()
+            await asyncio.Event().wait()
+        finally:
+            watcher.stop()
+            for timer in self._timers.values():
+                timer.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.state.close()
+
+    def _make_watcher(self):
+        if self.use_inotify and InotifyWatcher.available():
+            return InotifyWatcher(self.notify, self._on_overflow)
+        return PollingWatcher(self.notify, self.poll_interval)
+
+    async def rescan(self):
+        files = await get_executors().run_in_thread(
+            lambda: [path for directory in self.directories for path in walk_files(directory, self.recursive)]
+        )
+        for path in files:
+            self.notify(path)
+
+    def _on_overflow(self):
+        self._spawn(self.rescan())
+
+    def notify(self, path: str):
+        """
+        Сообщает о событии для файла. Каждое новое событие откладывает обработку на debounce секунд.
+        """
+        if self.is_ignored(path) or self.rule_for(path) is None:
+            return
+        timer = self._timers.pop(path, None)
+        if timer is not None:
+            timer.cancel()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self._signatures[path] = (stat.st_mtime_ns, stat.st_size)
+        loop = asyncio.get_running_loop()
+        self._timers[path] = loop.call_later(self.debounce, self._settled, path)
+
+    def _settled(self, path: str):
+        self._timers.pop(path, None)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._signatures.pop(path, None)
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        # Запись продолжается без событий (например, по сети) или файл уже обрабатывается
+        if self._signatures.get(path) != signature or path in self._active:
+            self._signatures[path] = signature
+            self._timers[path] = asyncio.get_running_loop().call_later(self.debounce, self._settled, path)
+            return
+        del self._signatures[path]
+        self._spawn(self._process(path, stat))
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _output_dir_for(self, path: str) -> str:
+        if self.output_dir is None:
+            return os.path.dirname(path)
+        root = next((directory for directory in self.directories if path.startswith(directory + os.sep)), None)
+        if root is None:
+            # Путь пришёл не в том виде, в каком задана папка (например, через символическую ссылку)
+            return self.output_dir
+        return os.path.join(self.output_dir, os.path.relpath(os.path.dirname(path), root))
+
+    async def _process(self, path: str, stat: os.stat_result):
+        rule = self.rule_for(path)
+        previous = self.state.get(path)
+        if previous is not None and previous[3] != 'failed' and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+            return
+
+        self._active.add(path)
+        try:
+            digest = await get_executors().run_in_thread(ResultCache.file_hash, path)
+            if previous is not None and previous[3] != 'failed' and previous[1:3] == (stat.st_size, digest):
+                self.state.touch(path, stat.st_mtime_ns)
+                return
+
+            job = BatchJob(path, rule.action, rule.target_format, options=rule.options)
+            job.output_path = output_path_for(job, self._output_dir_for(path))
+            # Несколько страниц PDF пишутся в папку рядом с output_path, а не в сам файл
+            expected = (job.output_path, pages_dir(job.output_path))
+            self._expected_outputs.update(expected)
+            try:
+                await self.queue.execute(job)
+                self.state.record(path, stat.st_mtime_ns, stat.st_size, digest, job.status, job.result)
+            finally:
+                # События записанного результата пришли во время задачи, дальше его узнаёт state.is_output
+                self._expected_outputs.difference_update(expected)
+            if self.on_job_done is not None:
+                self.on_job_done(job)
+        finally:
+            self._active.discard(path)
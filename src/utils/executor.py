@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+
+class JobCancelled(Exception):
+    """
+    Выбрасывается внутри задачи, когда её отменили.
+    """
+
+
+class CancelToken:
+    """
+    Флаг отмены, который задача проверяет между шагами работы.
+    Для задач в пуле процессов используется событие менеджера multiprocessing.
+    """
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+class Executors:
+    """
+    Общие пулы для тяжёлой работы инструментов:
+    пул потоков для I/O и кода, отпускающего GIL, пул процессов для CPU-нагрузки на Python.
+    Пулы создаются при первом использовании.
+    """
+
+    def __init__(self, threads: int, processes: int):
+        self.threads = threads or min(32, (os.cpu_count() or 1) + 4)
+        self.processes = processes or os.cpu_count() or 1
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="konvera")
+            return self._thread_pool
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._process_pool
+
+    def cancel_token(self, process: bool = False) -> CancelToken:
+        """
+        Создаёт флаг отмены. Для процессов событие должно пересекать границу процесса.
+        """
+        if not process:
+            return CancelToken()
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return CancelToken(self._manager.Event())
+
+    async def run_in_thread(self, func, *args, cancellable: bool = False, **kwargs):
+        """
+        Выполняет func в пуле потоков.
+        Если cancellable задан, func получает аргумент cancel с флагом отмены.
+        """
+        return await self._run(self.thread_pool, func, args, kwargs, cancellable, process=False)
+
+    async def run_in_process(self, func, *args, cancellable: bool = False, **kwargs):
+        """
+        Выполняет func в пуле процессов. func и аргументы должны сериализоваться pickle.
+        """
+        return await self._run(self.process_pool, func, args, kwargs, cancellable, process=True)
+
+    async def _run(self, pool: Executor, func, args, kwargs, cancellable: bool, process: bool):
+        token = None
+        if cancellable:
+            token = self.cancel_token(process)
+            kwargs = dict(kwargs, cancel=token)
+
+        future = pool.submit(partial(func, *args, **kwargs))
+        wrapped = asyncio.wrap_future(future)
+        try:
+            return await asyncio.shield(wrapped)
+        except asyncio.CancelledError:
+            # Задача ещё в очереди - просто снимаем её, иначе просим остановиться и ждём,
+            # чтобы она успела закрыть файлы до того, как вызывающий код продолжит работу
+            if not future.cancel():
+                if token is not None:
+                    token.cancel()
+                try:
+                    await wrapped
+                except Exception:
+                    pass
+            raise
+
+    def shutdown(self, wait: bool = False):
+        """
+        Останавливает пулы. wait=True дожидается завершения процессов пула,
+        например чтобы их время и память попали в getrusage(RUSAGE_CHILDREN).
+        """
+        with self._lock:
+            if self._thread_pool is not None:
+                self._thread_pool.shutdown(wait=wait, cancel_futures=True)
+                self._thread_pool = None
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=wait, cancel_futures=True)
+                self._process_pool = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+
+_executors: Optional[Executors] = None
+
+
+def get_executors() -> Executors:
+    """
+    Возвращает общие пулы, настроенные по секции [workers] конфигурации.
+    """
+    global _executors
+    if _executors is None:
+        from src.config import config
+
+        _executors = Executors(config.workers.threads, config.workers.processes)
+    return _executors
@@ -0,0 +1,135 @@
+import errno
+import os
+import stat
+import sys
+import tempfile
+
+from src.utils.executor import get_executors
+from src.utils.progress import ProgressCallback, report
+
+# Размер буфера для последнего способа - обычного копирования через Python
+BUFFER_SIZE = 8 * 1024 * 1024
+# Сколько байт копируется за один системный вызов copy_file_range/sendfile
+KERNEL_CHUNK_SIZE = 64 * 1024 * 1024
+# ioctl FICLONE из linux/fs.h
+FICLONE = 0x40049409
+
+# Ошибки, после которых имеет смысл попробовать следующий способ копирования
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY,
+                errno.EPERM, errno.EBADF}
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """
+    Клонирование файла copy-on-write (btrfs, XFS, APFS): данные не копируются вовсе.
+    """
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError as e:
+                if e.errno in _UNSUPPORTED:
+                    return False
+                raise
+        return True
+
+    if sys.platform == "darwin":
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        # clonefile не перезаписывает существующий файл
+        if os.path.exists(dst):
+            os.remove(dst)
+        return libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+    return False
+
+
+def _kernel_copy(src: str, dst: str, size: int, progress: ProgressCallback, use_sendfile: bool) -> bool:
+    """
+    Копирование внутри ядра через copy_file_range или sendfile, без буферов в памяти Python.
+    """
+    copy = os.sendfile if use_sendfile else getattr(os, "copy_file_range", None)
+    if copy is None:
+        return False
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        copied = 0
+        while copied < size:
+            try:
+                if use_sendfile:
+                    sent = copy(fdst.fileno(), fsrc.fileno(), copied, KERNEL_CHUNK_SIZE)
+                else:
+                    sent = copy(fsrc.fileno(), fdst.fileno(), KERNEL_CHUNK_SIZE, copied, copied)
+            except OSError as e:
+                if copied == 0 and e.errno in _UNSUPPORTED:
+                    return False
+                raise
+            if sent == 0:
+                break
+            copied += sent
+            report(progress, copied, size)
+    return copied == size
+
+
+def _buffer_copy(src: str, dst: str, size: int, progress: ProgressCallback):
+    buffer = bytearray(min(BUFFER_SIZE, max(size, 1)))
+    view = memoryview(buffer)
+    copied = 0
+    with open(src, "rb", buffering=0) as fsrc, open(dst, "wb", buffering=0) as fdst:
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                break
+            fdst.write(view[:read])
+            copied += read
+            report(progress, copied, size)
+
+
+def materialize_file(src: str, dst: str, progress: ProgressCallback = None) -> str:
+    """
+    Создаёт dst с содержимым src самым дешёвым доступным способом и возвращает его название:
+    'reflink', 'copy_file_range', 'sendfile' или 'copy'.
+    dst всегда независим от src: жёсткая ссылка не используется, изменение одного не затронет другой.
+    Результат появляется в dst целиком, через временный файл и os.replace.
+    """
+    size = os.path.getsize(src)
+    report(progress, 0, size)
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dst)), prefix=".konvera-")
+    os.close(fd)
+    try:
+        method = None
+        try:
+            if _reflink(src, tmp):
+                method = 'reflink'
+        except OSError:
+            pass
+
+        if method is None and _kernel_copy(src, tmp, size, progress, use_sendfile=False):
+            method = 'copy_file_range'
+        if method is None and hasattr(os, "sendfile") and sys.platform.startswith("linux") \
+                and _kernel_copy(src, tmp, size, progress, use_sendfile=True):
+            method = 'sendfile'
+        if method is None:
+            _buffer_copy(src, tmp, size, progress)
+            method = 'copy'
+
+        # mkstemp создаёт файл с правами 0600, копия получает права исходного файла
+        os.chmod(tmp, stat.S_IMODE(os.stat(src).st_mode))
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    report(progress, size, size)
+    return method
+
+
+async def async_materialize_file(src: str, dst: str, progress: ProgressCallback = None) -> str:
+    """
+    materialize_file в пуле потоков.
+    """
+    return await get_executors().run_in_thread(materialize_file, src, dst, progress)
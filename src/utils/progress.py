@@ -0,0 +1,61 @@
+import asyncio
+import time
+from typing import Callable, Optional
+
+# Колбэк прогресса: (сделано, всего). Единицы зависят от задачи: кадры, страницы или байты
+ProgressCallback = Callable[[int, int], None]
+
+
+def report(progress: Optional[ProgressCallback], done: int, total: int):
+    """
+    Сообщает прогресс, если колбэк передан.
+    """
+    if progress is not None:
+        progress(done, total)
+
+
+class ProgressStream:
+    """
+    Асинхронный поток прогресса для интерфейса.
+    Экземпляр передаётся в инструменты как колбэк и может вызываться из любого потока;
+    обновления чаще min_interval отбрасываются, а читатель всегда получает последнее значение.
+    """
+
+    def __init__(self, min_interval: float = 0.05, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.min_interval = min_interval
+        self._loop = loop or asyncio.get_event_loop()
+        self._changed = asyncio.Event()
+        self._value: Optional[tuple[int, int]] = None
+        self._last_report = 0.0
+        self._closed = False
+
+    def __call__(self, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self._last_report < self.min_interval:
+            return
+        self._last_report = now
+        self._loop.call_soon_threadsafe(self._set, (done, total))
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._finish)
+
+    def _set(self, value: tuple[int, int]):
+        self._value = value
+        self._changed.set()
+
+    def _finish(self):
+        self._closed = True
+        self._changed.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple[int, int]:
+        while True:
+            if self._value is not None:
+                value, self._value = self._value, None
+                return value
+            if self._closed:
+                raise StopAsyncIteration
+            self._changed.clear()
+            await self._changed.wait()
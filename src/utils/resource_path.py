@@ -1,11 +1,13 @@
 import os
 import sys
+from pathlib import Path
 
 
 def resource_path(relative_path: str) -> str:
     """
     Returns the absolute path to the given resource. This function works both
     in a development environment and in a compiled application (e.g., PyInstaller).
+    Resources live in the src package, so the path does not depend on the working directory.
 
     :param relative_path: The relative path of the resource.
     :return: The absolute path to the resource.
@@ -13,6 +15,6 @@ def resource_path(relative_path: str) -> str:
     try:
         base_path = sys._MEIPASS  # Used by PyInstaller
     except Exception:
-        base_path = os.path.abspath(".")
+        base_path = str(Path(__file__).resolve().parent.parent)
 
     return os.path.join(base_path, relative_path)